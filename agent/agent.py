@@ -2,94 +2,308 @@ import os
 import time
 import json
 import socket
+import random
 import requests
-import psutil
 from datetime import datetime, timezone
 
+import procfs
+import cgroups
+from summary import Window
+
 # ================= CONFIG =================
 NODE_ID = os.getenv("NODE_ID", socket.gethostname())
+# Node labels for filtering the node listing, e.g. NODE_LABELS="env=prod,rack=r1"
+NODE_LABELS = {}
+for item in filter(None, os.getenv("NODE_LABELS", "").split(",")):
+    key, _, value = item.partition("=")
+    NODE_LABELS[key.strip()] = value.strip()
 COLLECTOR_URL = os.getenv("COLLECTOR_URL", "http://collector:3000/ingest")
 INTERVAL = int(os.getenv("INTERVAL", "5"))
 
+# Adaptive sampling: back off towards MAX_INTERVAL while values are steady,
+# snap back to INTERVAL as soon as something moves.
+ADAPTIVE = os.getenv("ADAPTIVE", "true").lower() == "true"
+MAX_INTERVAL = float(os.getenv("MAX_INTERVAL", str(INTERVAL * 6)))
+BACKOFF_FACTOR = float(os.getenv("BACKOFF_FACTOR", "1.5"))
+PERCENT_THRESHOLD = float(os.getenv("PERCENT_THRESHOLD", "5"))  # points, for "%" metrics
+RELATIVE_THRESHOLD = float(os.getenv("RELATIVE_THRESHOLD", "0.2"))  # fraction, for the rest
+
+# Per-group collection intervals in seconds (groups not listed run every tick),
+# overridable with e.g. METRIC_INTERVALS="disk=120,procs=30"
+METRIC_INTERVALS = {"disk": 60, "procs": 30}
+for item in filter(None, os.getenv("METRIC_INTERVALS", "").split(",")):
+    group, _, seconds = item.partition("=")
+    METRIC_INTERVALS[group.strip()] = float(seconds)
+
+# Summary mode: sample every SAMPLE_INTERVAL seconds locally and ship one
+# count/min/max/sum/last record per metric every FLUSH_INTERVAL seconds.
+SUMMARY_MODE = os.getenv("SUMMARY_MODE", "false").lower() == "true"
+SAMPLE_INTERVAL = float(os.getenv("SAMPLE_INTERVAL", "1"))
+FLUSH_INTERVAL = float(os.getenv("FLUSH_INTERVAL", "60"))
+SUMMARY_URL = os.getenv("SUMMARY_URL", COLLECTOR_URL.rstrip("/") + "/summary")
+PERCENTILES = [float(q) for q in filter(None, os.getenv("PERCENTILES", "").split(","))]
+
+# Per-container collection from cgroup v2 ("auto" enables it when available)
+COLLECT_CONTAINERS = os.getenv("COLLECT_CONTAINERS", "auto").lower()
+CONTAINERS_URL = os.getenv("CONTAINERS_URL", COLLECTOR_URL.rstrip("/") + "/containers")
+
+CPU_COUNT = os.cpu_count() or 1
+
 
 # ================= METRICS =================
-def collect_metrics():
-    cpu = psutil.cpu_percent(interval=None)
-
-    mem = psutil.virtual_memory()
-
-    load_avg = psutil.getloadavg()[0]
-    disk = psutil.disk_usage('/')
-    net = psutil.net_io_counters()
-
-    metrics = [
-        {"name": "cpu_usage", "value": cpu, "unit": "%"},
-        {
-            "name": "mem_used",
-            "value": mem.used,
-            "unit": "bytes",
-        },
-        {
-            "name": "mem_total",
-            "value": mem.total,
-            "unit": "bytes",
-        },
-        {
+class Sampler:
+    """Reads /proc once per tick and turns cumulative counters into rates."""
+
+    def __init__(self):
+        self.devices = procfs.block_devices()
+        self.prev = {}
+        self.last_run = {}
+        self.groups = {
+            "cpu": self.cpu,
+            "load": self.load,
+            "mem": self.mem,
+            "net": self.net,
+            "diskio": self.diskio,
+            "disk": self.disk,
+            "procs": self.procs,
+        }
+
+    def _delta(self, key, values, now):
+        # Returns per-second rates since the previous reading, None on the first one
+        prev = self.prev.get(key)
+        self.prev[key] = (now, values)
+        if prev is None:
+            return None
+        elapsed = now - prev[0]
+        if elapsed <= 0:
+            return None
+        # Counters can reset (interface down, device removed); clamp to zero
+        return [max(v - p, 0) / elapsed for v, p in zip(values, prev[1])]
+
+    def cpu(self, now):
+        busy, total = procfs.read_cpu_times()
+        prev = self.prev.get("cpu")
+        self.prev["cpu"] = (now, (busy, total))
+        if prev is None or total == prev[1][1]:
+            return []
+        usage = (busy - prev[1][0]) / (total - prev[1][1]) * 100
+        return [{"name": "cpu_usage", "value": round(usage, 2), "unit": "%"}]
+
+    def load(self, now):
+        return [{
             "name": "load_avg_1m",
-            "value": (load_avg / psutil.cpu_count()) * 100,
+            "value": (procfs.read_loadavg() / CPU_COUNT) * 100,
             "unit": "%",
-        },
-        {
-            "name": "process_count",
-            "value": len(psutil.pids()),
-            "unit": "count",
-        },
-        {
-            "name": "disk_percent",
-            "value": disk.percent,
-            "unit": "%",
-        },
-        {
-            "name": "net_bytes_sent",
-            "value": net.bytes_sent,
-            "unit": "bytes",
-        },
-        {
-            "name": "net_bytes_recv",
-            "value": net.bytes_recv,
-            "unit": "bytes",
-        },
-    ]
-
-    return metrics
+        }]
+
+    def mem(self, now):
+        total, used = procfs.read_meminfo()
+        return [
+            {"name": "mem_used", "value": used, "unit": "bytes"},
+            {"name": "mem_total", "value": total, "unit": "bytes"},
+        ]
+
+    def net(self, now):
+        rates = self._delta("net", procfs.read_net_bytes(), now)
+        if rates is None:
+            return []
+        return [
+            {"name": "net_bytes_recv_rate", "value": rates[0], "unit": "bytes/s"},
+            {"name": "net_bytes_sent_rate", "value": rates[1], "unit": "bytes/s"},
+        ]
+
+    def diskio(self, now):
+        rates = self._delta("diskio", procfs.read_disk_io(self.devices), now)
+        if rates is None:
+            return []
+        return [
+            {"name": "disk_read_ops_rate", "value": rates[0], "unit": "ops/s"},
+            {"name": "disk_write_ops_rate", "value": rates[1], "unit": "ops/s"},
+            {"name": "disk_read_bytes_rate", "value": rates[2], "unit": "bytes/s"},
+            {"name": "disk_write_bytes_rate", "value": rates[3], "unit": "bytes/s"},
+        ]
+
+    def disk(self, now):
+        return [{"name": "disk_percent", "value": procfs.disk_percent("/"), "unit": "%"}]
+
+    def procs(self, now):
+        return [{"name": "process_count", "value": procfs.count_processes(), "unit": "count"}]
+
+    def collect(self):
+        now = time.monotonic()
+        metrics = []
+        for group, fn in self.groups.items():
+            interval = METRIC_INTERVALS.get(group, 0)
+            last = self.last_run.get(group)
+            if last is not None and now - last < interval:
+                continue
+            self.last_run[group] = now
+            try:
+                metrics.extend(fn(now))
+            except (OSError, ValueError, KeyError, IndexError) as e:
+                print(f"[agent] failed to collect {group}: {e}")
+        return metrics
+
+
+_sampler = None
+
+
+def collect_metrics():
+    global _sampler
+    if _sampler is None:
+        _sampler = Sampler()
+    return _sampler.collect()
+
+
+_tracker = None
+
+
+def containers_enabled():
+    if COLLECT_CONTAINERS == "auto":
+        return cgroups.is_cgroup_v2()
+    return COLLECT_CONTAINERS == "true"
+
+
+def collect_containers():
+    global _tracker
+    if _tracker is None:
+        _tracker = cgroups.ContainerTracker()
+    return _tracker.collect(time.monotonic())
+
+
+def send_containers(session):
+    payload = {
+        "node_id": NODE_ID,
+        "timestamp": datetime.now(timezone.utc).isoformat(),
+        "containers": collect_containers(),
+    }
+    if not payload["containers"]:
+        return
+    try:
+        response = session.post(CONTAINERS_URL, json=payload, headers={"traceparent": traceparent()}, timeout=3)
+        print(f"[agent] sent {len(payload['containers'])} containers ({response.status_code})")
+    except Exception as e:
+        print(f"[agent] failed to send container metrics: {e}")
+
+
+def has_changed(previous, metrics):
+    for m in metrics:
+        old = previous.get(m["name"])
+        if old is None:
+            return True
+        if m["unit"] == "%":
+            if abs(m["value"] - old) >= PERCENT_THRESHOLD:
+                return True
+        elif abs(m["value"] - old) > RELATIVE_THRESHOLD * max(abs(old), 1.0):
+            return True
+    return False
+
+
+def next_interval(current, changed):
+    if not ADAPTIVE or changed:
+        return INTERVAL
+    return min(current * BACKOFF_FACTOR, MAX_INTERVAL)
 
 
 # ================= PAYLOAD =================
-def build_payload():
-    return {
+def traceparent():
+    # W3C trace context, one trace per shipped payload
+    return f"00-{random.getrandbits(128):032x}-{random.getrandbits(64):016x}-01"
+
+
+def build_payload(metrics=None):
+    payload = {
         "node_id": NODE_ID,
         "timestamp": datetime.now(timezone.utc).isoformat(),
-        "metrics": collect_metrics(),
+        "metrics": collect_metrics() if metrics is None else metrics,
+    }
+    if NODE_LABELS:
+        payload["labels"] = NODE_LABELS
+    return payload
+
+
+def build_summary_payload(window_start, window_end, summaries):
+    payload = {
+        "node_id": NODE_ID,
+        "window_start": window_start.isoformat(),
+        "window_end": window_end.isoformat(),
+        "summaries": summaries,
     }
+    if NODE_LABELS:
+        payload["labels"] = NODE_LABELS
+    return payload
 
 
 # ================= LOOP =================
+def run_summary():
+    print(f"[agent] starting node agent in summary mode: node_id={NODE_ID}, "
+          f"sample={SAMPLE_INTERVAL}s, flush={FLUSH_INTERVAL}s")
+    print(f"[agent] sending summaries to {SUMMARY_URL}")
+
+    session = requests.Session()
+    with_containers = containers_enabled()
+    window = Window(PERCENTILES)
+    window_start = datetime.now(timezone.utc)
+    next_flush = time.monotonic() + FLUSH_INTERVAL
+
+    while True:
+        tick = time.monotonic()
+        window.add(collect_metrics())
+
+        if tick >= next_flush:
+            window_end = datetime.now(timezone.utc)
+            payload = build_summary_payload(window_start, window_end, window.flush())
+            window_start = window_end
+            next_flush += FLUSH_INTERVAL
+
+            if payload["summaries"]:
+                try:
+                    response = session.post(SUMMARY_URL, json=payload, headers={"traceparent": traceparent()}, timeout=3)
+                    print(f"[agent] sent {len(payload['summaries'])} summaries ({response.status_code})")
+                except Exception as e:
+                    print(f"[agent] failed to send summaries: {e}")
+
+            if with_containers:
+                send_containers(session)
+
+        time.sleep(max(SAMPLE_INTERVAL - (time.monotonic() - tick), 0))
+
+
 def run():
     print(f"[agent] starting node agent: node_id={NODE_ID}, interval={INTERVAL}s")
     print(f"[agent] sending metrics to {COLLECTOR_URL}")
+    if ADAPTIVE:
+        print(f"[agent] adaptive sampling enabled (max interval {MAX_INTERVAL}s)")
+
+    session = requests.Session()
+    with_containers = containers_enabled()
+    if with_containers:
+        print(f"[agent] per-container metrics enabled, sending to {CONTAINERS_URL}")
+    last_values = {}
+    interval = INTERVAL
 
     while True:
-        payload = build_payload()
+        metrics = collect_metrics()
+        interval = next_interval(interval, has_changed(last_values, metrics))
+        last_values.update((m["name"], m["value"]) for m in metrics)
+
+        payload = build_payload(metrics)
         print(json.dumps(payload, indent=2), flush=True)
 
         try:
-            response = requests.post(COLLECTOR_URL, json=payload, timeout=3)
+            response = session.post(COLLECTOR_URL, json=payload, headers={"traceparent": traceparent()}, timeout=3)
             print(f"[agent] sent metrics ({response.status_code})")
         except Exception as e:
             print(f"[agent] failed to send metrics: {e}")
 
-        time.sleep(INTERVAL)
+        if with_containers:
+            send_containers(session)
+
+        time.sleep(interval)
 
 
 if __name__ == "__main__":
-    run()
+    if SUMMARY_MODE:
+        run_summary()
+    else:
+        run()
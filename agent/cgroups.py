@@ -0,0 +1,171 @@
+import os
+import re
+import json
+
+CGROUP_ROOT = os.getenv("CGROUP_ROOT", "/sys/fs/cgroup")
+DOCKER_ROOT = os.getenv("DOCKER_ROOT", "/var/lib/docker")
+
+# Parent cgroups that hold one child per container, for the systemd and
+# cgroupfs docker drivers respectively.
+CONTAINER_PARENTS = ("system.slice", "docker")
+CONTAINER_DIR = re.compile(r"^(?:docker-)?([0-9a-f]{64})(?:\.scope)?$")
+
+
+def is_cgroup_v2(root=CGROUP_ROOT):
+    return os.path.exists(os.path.join(root, "cgroup.controllers"))
+
+
+def _parse_keyed(text):
+    # "key value" per line (cpu.stat)
+    out = {}
+    for line in text.splitlines():
+        key, _, value = line.partition(" ")
+        if value:
+            out[key] = int(value)
+    return out
+
+
+def _parse_io(text):
+    # "8:0 rbytes=1 wbytes=2 rios=3 wios=4 ..." per device, summed
+    totals = {"rbytes": 0, "wbytes": 0, "rios": 0, "wios": 0}
+    for line in text.splitlines():
+        for field in line.split()[1:]:
+            key, _, value = field.partition("=")
+            if key in totals:
+                totals[key] += int(value)
+    return totals
+
+
+def read_labels(container_id):
+    # Read once per container from the docker state dir (mounted read-only)
+    path = os.path.join(DOCKER_ROOT, "containers", container_id, "config.v2.json")
+    try:
+        with open(path) as f:
+            config = json.load(f)
+    except (OSError, ValueError):
+        return container_id[:12], {}
+    name = config.get("Name", "").lstrip("/") or container_id[:12]
+    labels = (config.get("Config") or {}).get("Labels") or {}
+    return name, labels
+
+
+class Container:
+    """Open file descriptors for one container cgroup, re-read with pread."""
+
+    FILES = ("cpu.stat", "memory.current", "io.stat")
+
+    def __init__(self, container_id, path):
+        self.id = container_id
+        self.path = path
+        self.name, self.labels = read_labels(container_id)
+        self.fds = {}
+        for fname in self.FILES:
+            try:
+                self.fds[fname] = os.open(os.path.join(path, fname), os.O_RDONLY)
+            except OSError:
+                # Controller not enabled for this cgroup
+                pass
+
+    def read(self, fname):
+        fd = self.fds.get(fname)
+        if fd is None:
+            return None
+        return os.pread(fd, 65536, 0).decode()
+
+    def close(self):
+        for fd in self.fds.values():
+            try:
+                os.close(fd)
+            except OSError:
+                pass
+        self.fds = {}
+
+
+class ContainerTracker:
+    """
+    Tracks container cgroups across ticks. Parent directories are re-listed
+    every refresh (kernfs doesn't bump a parent's mtime when children come
+    and go) and diffed against the known set, so only new containers have
+    their files opened and labels read.
+    """
+
+    def __init__(self, root=CGROUP_ROOT):
+        self.parents = [os.path.join(root, p) for p in CONTAINER_PARENTS]
+        self.containers = {}
+        self.prev = {}
+
+    def refresh(self):
+        for parent in self.parents:
+            self._rescan(parent)
+
+    def _rescan(self, parent):
+        seen = set()
+        try:
+            entries = list(os.scandir(parent))
+        except OSError:
+            entries = []
+        for entry in entries:
+            match = CONTAINER_DIR.match(entry.name)
+            if match and entry.is_dir():
+                seen.add(match.group(1))
+                if match.group(1) not in self.containers:
+                    self.containers[match.group(1)] = Container(match.group(1), entry.path)
+
+        for container_id, c in list(self.containers.items()):
+            if os.path.dirname(c.path) == parent and container_id not in seen:
+                self.drop(container_id)
+
+    def drop(self, container_id):
+        c = self.containers.pop(container_id, None)
+        if c is not None:
+            c.close()
+        self.prev.pop(container_id, None)
+
+    def collect(self, now):
+        self.refresh()
+        batch = []
+        for c in list(self.containers.values()):
+            try:
+                metrics = self._sample(c, now)
+            except OSError:
+                # cgroup removed between refresh and read; a recreated one is picked up on the next refresh
+                self.drop(c.id)
+                continue
+            batch.append({"id": c.id, "name": c.name, "labels": c.labels, "metrics": metrics})
+        return batch
+
+    def _sample(self, c, now):
+        metrics = []
+        cpu = c.read("cpu.stat")
+        mem = c.read("memory.current")
+        io = c.read("io.stat")
+
+        counters = {}
+        if cpu is not None:
+            counters["cpu_usec"] = _parse_keyed(cpu).get("usage_usec", 0)
+        if io is not None:
+            counters.update(_parse_io(io))
+        if mem is not None:
+            metrics.append({"name": "mem_used", "value": int(mem), "unit": "bytes"})
+
+        prev = self.prev.get(c.id)
+        self.prev[c.id] = (now, counters)
+        if prev is None or now <= prev[0]:
+            return metrics
+
+        elapsed = now - prev[0]
+
+        def rate(key):
+            return max(counters[key] - prev[1].get(key, 0), 0) / elapsed
+
+        if "cpu_usec" in counters:
+            # usec of CPU per second of wall time, as % of one core
+            metrics.append({"name": "cpu_usage", "value": rate("cpu_usec") / 1e4, "unit": "%"})
+        if "rbytes" in counters:
+            metrics.extend([
+                {"name": "disk_read_bytes_rate", "value": rate("rbytes"), "unit": "bytes/s"},
+                {"name": "disk_write_bytes_rate", "value": rate("wbytes"), "unit": "bytes/s"},
+                {"name": "disk_read_ops_rate", "value": rate("rios"), "unit": "ops/s"},
+                {"name": "disk_write_ops_rate", "value": rate("wios"), "unit": "ops/s"},
+            ])
+        return metrics
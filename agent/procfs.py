@@ -0,0 +1,92 @@
+import os
+
+# Point at a bind-mounted host /proc (e.g. /host/proc) to report host-wide values
+PROC_ROOT = os.getenv("PROC_ROOT", "/proc")
+SYS_ROOT = os.getenv("SYS_ROOT", "/sys")
+
+SECTOR_SIZE = 512
+
+
+def _read(path):
+    with open(os.path.join(PROC_ROOT, path)) as f:
+        return f.read()
+
+
+# ================= CPU =================
+def read_cpu_times():
+    # First line of /proc/stat: "cpu user nice system idle iowait irq softirq steal ..."
+    with open(os.path.join(PROC_ROOT, "stat")) as f:
+        fields = f.readline().split()[1:]
+
+    values = [int(v) for v in fields[:8]]
+    idle = values[3] + values[4]  # idle + iowait
+    total = sum(values)
+    return total - idle, total
+
+
+def read_loadavg():
+    return float(_read("loadavg").split()[0])
+
+
+# ================= MEMORY =================
+def read_meminfo():
+    info = {}
+    for line in _read("meminfo").splitlines():
+        key, _, rest = line.partition(":")
+        if key in ("MemTotal", "MemAvailable"):
+            info[key] = int(rest.split()[0]) * 1024
+            if len(info) == 2:
+                break
+    return info["MemTotal"], info["MemTotal"] - info["MemAvailable"]
+
+
+# ================= NETWORK =================
+def read_net_bytes():
+    rx = tx = 0
+    # Two header lines, then "iface: rx_bytes ... (8 rx fields) tx_bytes ..."
+    for line in _read("net/dev").splitlines()[2:]:
+        iface, _, data = line.partition(":")
+        if iface.strip() == "lo":
+            continue
+        fields = data.split()
+        rx += int(fields[0])
+        tx += int(fields[8])
+    return rx, tx
+
+
+# ================= DISK =================
+def block_devices():
+    # Whole disks only, so partitions are not counted twice
+    try:
+        names = os.listdir(os.path.join(SYS_ROOT, "block"))
+    except OSError:
+        return None
+    return {n for n in names if not n.startswith(("loop", "ram"))}
+
+
+def read_disk_io(devices=None):
+    reads = writes = read_bytes = write_bytes = 0
+    for line in _read("diskstats").splitlines():
+        fields = line.split()
+        if len(fields) < 10:
+            continue
+        if devices is not None and fields[2] not in devices:
+            continue
+        reads += int(fields[3])
+        read_bytes += int(fields[5]) * SECTOR_SIZE
+        writes += int(fields[7])
+        write_bytes += int(fields[9]) * SECTOR_SIZE
+    return reads, writes, read_bytes, write_bytes
+
+
+def disk_percent(path="/"):
+    st = os.statvfs(path)
+    used = (st.f_blocks - st.f_bfree) * st.f_frsize
+    avail = st.f_bavail * st.f_frsize
+    total = used + avail
+    return (used / total) * 100 if total else 0.0
+
+
+# ================= PROCESSES =================
+def count_processes():
+    return sum(1 for name in os.listdir(PROC_ROOT) if name.isdigit())
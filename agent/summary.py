@@ -0,0 +1,69 @@
+import math
+
+
+class Series:
+    __slots__ = ("unit", "count", "min", "max", "sum", "last", "values")
+
+    def __init__(self, unit, keep_values):
+        self.unit = unit
+        self.count = 0
+        self.min = math.inf
+        self.max = -math.inf
+        self.sum = 0.0
+        self.last = None
+        self.values = [] if keep_values else None
+
+    def add(self, value):
+        self.count += 1
+        self.sum += value
+        self.last = value
+        if value < self.min:
+            self.min = value
+        if value > self.max:
+            self.max = value
+        if self.values is not None:
+            self.values.append(value)
+
+
+def percentile(sorted_values, q):
+    # Nearest-rank percentile
+    if not sorted_values:
+        return None
+    rank = max(math.ceil(q / 100 * len(sorted_values)), 1)
+    return sorted_values[rank - 1]
+
+
+class Window:
+    """Accumulates high-frequency samples into one summary per metric."""
+
+    def __init__(self, percentiles=()):
+        self.percentiles = tuple(percentiles)
+        self.series = {}
+
+    def add(self, metrics):
+        for m in metrics:
+            s = self.series.get(m["name"])
+            if s is None:
+                s = self.series[m["name"]] = Series(m.get("unit"), bool(self.percentiles))
+            s.add(float(m["value"]))
+
+    def flush(self):
+        summaries = []
+        for name, s in self.series.items():
+            summary = {
+                "name": name,
+                "unit": s.unit,
+                "count": s.count,
+                "min": s.min,
+                "max": s.max,
+                "sum": s.sum,
+                "last": s.last,
+            }
+            if s.values:
+                ordered = sorted(s.values)
+                summary["percentiles"] = {
+                    f"p{q:g}": percentile(ordered, q) for q in self.percentiles
+                }
+            summaries.append(summary)
+        self.series = {}
+        return summaries
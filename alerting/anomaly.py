@@ -0,0 +1,134 @@
+import io
+import numpy as np
+
+SEASONS = 24  # hour-of-day buckets
+
+
+class SeriesStats:
+    """
+    Streaming per-(node, metric) statistics kept in flat numpy arrays.
+
+    Every series has an EWMA mean/variance over all observations plus an
+    hour-of-day seasonal EWMA, so an observation can be scored against both
+    "what this series usually does" and "what it usually does at this hour".
+    Updates and scoring are vectorized over all series seen in a cycle.
+    """
+
+    def __init__(self, alpha=0.1, seasonal_alpha=0.05, capacity=1024):
+        self.alpha = alpha
+        self.seasonal_alpha = seasonal_alpha
+        self.keys = []
+        self.index = {}
+        self._alloc(capacity)
+
+    def _alloc(self, capacity):
+        self.mean = np.zeros(capacity)
+        self.var = np.zeros(capacity)
+        self.count = np.zeros(capacity, dtype=np.int64)
+        # Seasonal buckets dominate memory, so they are kept in 32-bit
+        self.s_mean = np.zeros((capacity, SEASONS), dtype=np.float32)
+        self.s_var = np.zeros((capacity, SEASONS), dtype=np.float32)
+        self.s_count = np.zeros((capacity, SEASONS), dtype=np.int32)
+
+    def _grow(self, needed):
+        capacity = len(self.mean)
+        if needed <= capacity:
+            return
+        while capacity < needed:
+            capacity *= 2
+        old = (self.mean, self.var, self.count, self.s_mean, self.s_var, self.s_count)
+        self._alloc(capacity)
+        for new, prev in zip((self.mean, self.var, self.count, self.s_mean, self.s_var, self.s_count), old):
+            new[:len(prev)] = prev
+
+    def rows(self, keys):
+        out = np.empty(len(keys), dtype=np.int64)
+        for i, key in enumerate(keys):
+            row = self.index.get(key)
+            if row is None:
+                row = self.index[key] = len(self.keys)
+                self.keys.append(key)
+            out[i] = row
+        self._grow(len(self.keys))
+        return out
+
+    def forget(self, predicate):
+        # Drop series (e.g. of deleted nodes) and compact the arrays
+        keep = [i for i, key in enumerate(self.keys) if not predicate(key)]
+        if len(keep) == len(self.keys):
+            return
+        idx = np.array(keep, dtype=np.int64)
+        for name in ("mean", "var", "count", "s_mean", "s_var", "s_count"):
+            arr = getattr(self, name)
+            compacted = np.zeros_like(arr)
+            compacted[:len(keep)] = arr[idx]
+            setattr(self, name, compacted)
+        self.keys = [self.keys[i] for i in keep]
+        self.index = {key: i for i, key in enumerate(self.keys)}
+
+    def update(self, rows, values, hours):
+        """
+        Fold one observation per row into the running statistics.
+        Returns the state from *before* the update, for scoring.
+        """
+        before = {
+            "mean": self.mean[rows],
+            "var": self.var[rows],
+            "count": self.count[rows],
+            "s_mean": self.s_mean[rows, hours],
+            "s_var": self.s_var[rows, hours],
+            "s_count": self.s_count[rows, hours],
+        }
+
+        # Incremental EWMA mean/variance; the first observation seeds the mean
+        mean, var, count = before["mean"], before["var"], before["count"]
+        diff = values - mean
+        incr = self.alpha * diff
+        self.mean[rows] = np.where(count == 0, values, mean + incr)
+        self.var[rows] = np.where(count == 0, 0.0, (1 - self.alpha) * (var + diff * incr))
+        self.count[rows] = count + 1
+
+        s_mean, s_var, s_count = before["s_mean"], before["s_var"], before["s_count"]
+        s_diff = values - s_mean
+        s_incr = self.seasonal_alpha * s_diff
+        self.s_mean[rows, hours] = np.where(s_count == 0, values, s_mean + s_incr)
+        self.s_var[rows, hours] = np.where(s_count == 0, 0.0, (1 - self.seasonal_alpha) * (s_var + s_diff * s_incr))
+        self.s_count[rows, hours] = s_count + 1
+
+        return before
+
+    # ================= PERSISTENCE =================
+    def dumps(self, cursor):
+        n = len(self.keys)
+        buf = io.BytesIO()
+        np.savez_compressed(
+            buf,
+            keys=np.array(["\x1f".join(k) for k in self.keys], dtype=str),
+            mean=self.mean[:n], var=self.var[:n], count=self.count[:n],
+            s_mean=self.s_mean[:n], s_var=self.s_var[:n], s_count=self.s_count[:n],
+            cursor=np.array([cursor]),
+        )
+        return buf.getvalue()
+
+    @classmethod
+    def loads(cls, data, alpha=0.1, seasonal_alpha=0.05):
+        with np.load(io.BytesIO(data)) as f:
+            keys = [tuple(k.split("\x1f")) for k in f["keys"].tolist()]
+            stats = cls(alpha, seasonal_alpha, capacity=max(len(keys), 1024))
+            n = len(keys)
+            stats.keys = keys
+            stats.index = {key: i for i, key in enumerate(keys)}
+            stats.mean[:n] = f["mean"]
+            stats.var[:n] = f["var"]
+            stats.count[:n] = f["count"]
+            stats.s_mean[:n] = f["s_mean"]
+            stats.s_var[:n] = f["s_var"]
+            stats.s_count[:n] = f["s_count"]
+            cursor = float(f["cursor"][0])
+        return stats, cursor
+
+
+def zscore(values, mean, var, min_std_abs, min_std_rel):
+    # Floor the deviation so near-constant series don't turn noise into alerts
+    std = np.maximum(np.sqrt(np.maximum(var, 0.0)), np.maximum(min_std_abs, min_std_rel * np.abs(mean)))
+    return (values - mean) / std
@@ -3,6 +3,10 @@ import time
 import datetime
 import psycopg2
 import logging
+import numpy as np
+
+from anomaly import SeriesStats, zscore
+from notify import AlertGrouper, Dispatcher, sinks_from_env
 
 # Configuration
 DB_HOST = os.getenv("DB_HOST", "timescaledb")
@@ -11,9 +15,162 @@ DB_PASS = os.getenv("DB_PASS", "nodesensepass")
 DB_NAME = os.getenv("DB_NAME", "nodesense")
 CHECK_INTERVAL = int(os.getenv("CHECK_INTERVAL", "60"))
 
+# Fixed ceiling, skipped for nodes whose learned baseline is already above it
+CPU_THRESHOLD = float(os.getenv("CPU_THRESHOLD", "90"))
+
+# Streaming anomaly detection
+ANOMALY_METRICS = [m.strip() for m in os.getenv("ANOMALY_METRICS", "cpu_usage,mem_used,load_avg_1m,disk_percent").split(",") if m.strip()]
+Z_THRESHOLD = float(os.getenv("Z_THRESHOLD", "4"))
+WARMUP = int(os.getenv("ANOMALY_WARMUP", "30"))  # observations before a series can alert
+SEASONAL_WARMUP = int(os.getenv("SEASONAL_WARMUP", "5"))  # per hour-of-day bucket
+EWMA_ALPHA = float(os.getenv("EWMA_ALPHA", "0.1"))
+SEASONAL_ALPHA = float(os.getenv("SEASONAL_ALPHA", "0.05"))
+MIN_STD_ABS = float(os.getenv("MIN_STD_ABS", "1.0"))
+MIN_STD_REL = float(os.getenv("MIN_STD_REL", "0.05"))
+PERSIST_INTERVAL = int(os.getenv("PERSIST_INTERVAL", "300"))
+INGEST_GRACE = int(os.getenv("INGEST_GRACE", "5"))  # seconds left for late samples to land
+
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 
+_stats = None
+_cursor = None
+_last_persist = 0.0
+
+_grouper = AlertGrouper()
+_dispatcher = None
+
+
+# ================= STATE =================
+def init_state_table(cur):
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS anomaly_state (
+            id TEXT PRIMARY KEY,
+            updated_at TIMESTAMPTZ NOT NULL,
+            data BYTEA NOT NULL
+        );
+    """)
+
+
+def load_state(cur):
+    cur.execute("SELECT data FROM anomaly_state WHERE id = 'series_stats'")
+    row = cur.fetchone()
+    if row:
+        try:
+            stats, cursor = SeriesStats.loads(bytes(row[0]), EWMA_ALPHA, SEASONAL_ALPHA)
+            logging.info(f"Loaded anomaly state for {len(stats.keys)} series")
+            return stats, cursor
+        except Exception as e:
+            logging.error(f"Discarding unreadable anomaly state: {e}")
+    # Start fresh from now rather than rescanning history
+    return SeriesStats(EWMA_ALPHA, SEASONAL_ALPHA), time.time() - CHECK_INTERVAL
+
+
+def save_state(cur, stats, cursor):
+    cur.execute("SELECT id FROM nodes WHERE deleted_at IS NULL")
+    live = {r[0] for r in cur.fetchall()}
+    stats.forget(lambda key: key[0] not in live)
+
+    cur.execute("""
+        INSERT INTO anomaly_state (id, updated_at, data)
+        VALUES ('series_stats', now(), %s)
+        ON CONFLICT (id) DO UPDATE SET updated_at = EXCLUDED.updated_at, data = EXCLUDED.data
+    """, (psycopg2.Binary(stats.dumps(cursor)),))
+
+
+# ================= RULES =================
+def fetch_observations(cur, since, until):
+    # One mean per series for the cycle, from raw samples and agent summaries
+    cur.execute("""
+        SELECT node_id, metric_name, sum(total) / sum(n)
+        FROM (
+            SELECT node_id, metric_name, sum(value) AS total, count(*) AS n
+            FROM metrics
+            WHERE metric_name = ANY(%(names)s) AND time > %(since)s AND time <= %(until)s
+            GROUP BY node_id, metric_name
+            UNION ALL
+            SELECT node_id, metric_name, sum(sum), sum(count)
+            FROM metric_summaries
+            WHERE metric_name = ANY(%(names)s) AND window_end > %(since)s AND window_end <= %(until)s
+            GROUP BY node_id, metric_name
+        ) s
+        GROUP BY node_id, metric_name;
+    """, {"names": ANOMALY_METRICS, "since": since, "until": until})
+    return cur.fetchall()
+
+
+def detect_anomalies(stats, observations, hour):
+    if not observations:
+        return []
+
+    keys = [(r[0], r[1]) for r in observations]
+    values = np.fromiter((r[2] for r in observations), dtype=np.float64, count=len(observations))
+    rows = stats.rows(keys)
+    hours = np.full(len(rows), hour)
+
+    before = stats.update(rows, values, hours)
+    z = zscore(values, before["mean"], before["var"], MIN_STD_ABS, MIN_STD_REL)
+    sz = zscore(values, before["s_mean"], before["s_var"], MIN_STD_ABS, MIN_STD_REL)
+
+    # Upward deviation from the overall baseline, confirmed by the hour-of-day
+    # baseline once that bucket has enough history
+    fired = (before["count"] >= WARMUP) & (z > Z_THRESHOLD) & (
+        (before["s_count"] < SEASONAL_WARMUP) | (sz > Z_THRESHOLD)
+    )
+    return [
+        (keys[i][0], keys[i][1], float(values[i]), float(before["mean"][i]), float(z[i]))
+        for i in np.flatnonzero(fired)
+    ]
+
+
+def cpu_baseline(stats, node_id):
+    row = stats.index.get((node_id, "cpu_usage"))
+    if row is None or stats.count[row] < WARMUP:
+        return None
+    return float(stats.mean[row])
+
+
+def flush_notifications(cur, ready):
+    # One alerts row per (rule, window) group in `ready`; delivered by deliver() after commit
+    if ready:
+        cur.executemany(
+            "INSERT INTO alerts (node_id, message, timestamp) VALUES (%s, %s, %s)",
+            [(n["node_id"], n["title"], n["last"]) for n in ready],
+        )
+
+
+def deliver(ready):
+    # Only dequeue groups whose alerts rows are committed; on failure they stay queued
+    if not ready:
+        return
+    _grouper.ack(ready, time.time())
+    if _dispatcher:
+        for n in ready:
+            _dispatcher.submit(n)
+
+
+def flush_pending_groups():
+    # Between checks, send groups whose window has elapsed; only connect when there are some
+    ready = _grouper.ready(time.time())
+    if not ready:
+        return
+    conn = None
+    try:
+        conn = psycopg2.connect(host=DB_HOST, user=DB_USER, password=DB_PASS, database=DB_NAME)
+        cur = conn.cursor()
+        flush_notifications(cur, ready)
+        conn.commit()
+        deliver(ready)
+        cur.close()
+    except Exception as e:
+        logging.error(f"Error flushing notifications: {e}")
+    finally:
+        if conn:
+            conn.close()
+
+
 def check_metrics():
+    global _stats, _cursor, _last_persist
+
     conn = None
     try:
         conn = psycopg2.connect(
@@ -23,50 +180,76 @@ def check_metrics():
             database=DB_NAME
         )
         cur = conn.cursor()
-        
-        # Example: Check for high CPU usage (> 90%) in the last minute
-        # Assuming table 'metrics' with columns: time, metric, value, node_id
-        # Note: Adjust table/column names based on actual schema if known. 
-        # Based on previous phases, we assume a simple schema.
-        
-        query = """
-        SELECT time, node_id, value 
-        FROM metrics 
-        WHERE metric_name = 'cpu_usage' 
-          AND value > 90.0 
-          AND time > NOW() - INTERVAL '1 minute';
-        """
-        
-        cur.execute(query)
-        rows = cur.fetchall()
-        
-        if rows:
-            for row in rows:
-                msg = f"High CPU usage detected! Node: {row[1]}, Value: {row[2]}"
-                logging.warning(f"ALERT: {msg}, Time: {row[0]}")
-                # Persist to DB
-                cur.execute("INSERT INTO alerts (node_id, message, timestamp) VALUES (%s, %s, %s)", (row[1], msg, row[0]))
-                conn.commit()
-        
+
+        if _stats is None:
+            init_state_table(cur)
+            conn.commit()
+            _stats, _cursor = load_state(cur)
+
+        now = datetime.datetime.now(datetime.timezone.utc)
+        since = datetime.datetime.fromtimestamp(_cursor, datetime.timezone.utc)
+        until = now - datetime.timedelta(seconds=INGEST_GRACE)
+        alerts = []
+
+        # Streaming statistics: z-score against per-series EWMA and seasonal baselines
+        started = time.perf_counter()
+        observations = fetch_observations(cur, since, until)
+        anomalies = detect_anomalies(_stats, observations, until.hour)
+        _cursor = until.timestamp()
+        logging.info(f"Scored {len(observations)} series in {(time.perf_counter() - started) * 1000:.1f} ms")
+
+        for node_id, metric, value, baseline, z in anomalies:
+            msg = f"Anomaly detected! Node: {node_id}, Metric: {metric}, Value: {value:.2f}, Baseline: {baseline:.2f}, z={z:.1f}"
+            alerts.append((f"Anomaly {metric}", node_id, msg, until))
+
+        # Fixed CPU ceiling, one alert per node per cycle
+        cur.execute("""
+            SELECT node_id, max(value), max(time)
+            FROM (
+                SELECT node_id, value, time
+                FROM metrics
+                WHERE metric_name = 'cpu_usage' AND value > %(limit)s AND time > NOW() - INTERVAL '1 minute'
+                UNION ALL
+                SELECT node_id, max, window_end
+                FROM metric_summaries
+                WHERE metric_name = 'cpu_usage' AND max > %(limit)s AND window_end > NOW() - INTERVAL '1 minute'
+            ) s
+            GROUP BY node_id;
+        """, {"limit": CPU_THRESHOLD})
+        for node_id, value, ts in cur.fetchall():
+            baseline = cpu_baseline(_stats, node_id)
+            if baseline is not None and baseline > CPU_THRESHOLD:
+                # Always runs hot; the anomaly rule covers deviations from that
+                continue
+            alerts.append(("High CPU", node_id, f"High CPU usage detected! Node: {node_id}, Value: {value}", ts))
+
         # Check for Node Down (No report in last 2 minutes)
         cur.execute("""
-            SELECT id, last_seen 
-            FROM nodes 
-            WHERE last_seen < NOW() - INTERVAL '2 minutes';
+            SELECT id, last_seen
+            FROM nodes
+            WHERE last_seen < NOW() - INTERVAL '2 minutes' AND deleted_at IS NULL;
         """)
-        down_nodes = cur.fetchall()
-        for node in down_nodes:
-            msg = f"Node Down detected! Node: {node[0]}"
-            logging.warning(f"ALERT: {msg}, Last Seen: {node[1]}")
-            # Persist to DB
-            cur.execute("INSERT INTO alerts (node_id, message, timestamp) VALUES (%s, %s, %s)", (node[0], msg, datetime.datetime.now(datetime.timezone.utc)))
-            conn.commit()
+        for node in cur.fetchall():
+            alerts.append(("Node Down", node[0], f"Node Down detected! Node: {node[0]}", now))
 
-        if not rows and not down_nodes:
+        for _, _, msg, ts in alerts:
+            logging.warning(f"ALERT: {msg}, Time: {ts}")
+        # Repeats of still-firing (rule, node) pairs are dropped here
+        _grouper.add(alerts, time.time())
+        if not alerts:
             logging.info("No anomalies detected.")
-            
+        ready = _grouper.ready(time.time())
+        flush_notifications(cur, ready)
+        conn.commit()
+        deliver(ready)
+
+        if time.time() - _last_persist >= PERSIST_INTERVAL:
+            save_state(cur, _stats, _cursor)
+            _last_persist = time.time()
+
+        conn.commit()
         cur.close()
-        
+
     except Exception as e:
         logging.error(f"Error checking metrics: {e}")
     finally:
@@ -75,9 +258,16 @@ def check_metrics():
 
 if __name__ == "__main__":
     logging.info("Starting Alerting Service...")
+    sinks = sinks_from_env()
+    if sinks:
+        _dispatcher = Dispatcher(sinks)
+        logging.info(f"Notification sinks: {', '.join(s.name for s in sinks)}")
     # Give DB some time to come up
-    time.sleep(5) 
-    
+    time.sleep(5)
+
     while True:
         check_metrics()
-        time.sleep(CHECK_INTERVAL)
+        deadline = time.time() + CHECK_INTERVAL
+        while time.time() < deadline:
+            time.sleep(min(1.0, max(deadline - time.time(), 0)))
+            flush_pending_groups()
@@ -0,0 +1,271 @@
+import os
+import json
+import time
+import heapq
+import smtplib
+import logging
+import threading
+import itertools
+from email.message import EmailMessage
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+# Grouping / dedup
+# Seconds a group keeps collecting alerts before it is sent; 0 groups per check cycle
+GROUP_WAIT = float(os.getenv("NOTIFY_GROUP_WAIT", "0"))
+REPEAT_INTERVAL = float(os.getenv("NOTIFY_REPEAT_INTERVAL", "3600"))  # re-notify a still-firing (rule, node) after this
+MAX_NODES_IN_MESSAGE = 10
+
+# Delivery
+NOTIFY_WORKERS = int(os.getenv("NOTIFY_WORKERS", "4"))
+NOTIFY_MAX_RETRIES = int(os.getenv("NOTIFY_MAX_RETRIES", "5"))
+NOTIFY_RETRY_BACKOFF = float(os.getenv("NOTIFY_RETRY_BACKOFF", "2"))
+NOTIFY_RATE_PER_MIN = float(os.getenv("NOTIFY_RATE_PER_MIN", "30"))
+NOTIFY_TIMEOUT = float(os.getenv("NOTIFY_TIMEOUT", "5"))
+
+
+# ================= GROUPING =================
+class AlertGrouper:
+    """
+    Collapses individual (rule, node) alerts into one notification per rule
+    and time window, and suppresses repeats of alerts that are still firing.
+    """
+
+    def __init__(self, group_wait=GROUP_WAIT, repeat_interval=REPEAT_INTERVAL):
+        self.group_wait = group_wait
+        self.repeat_interval = repeat_interval
+        self.last_notified = {}
+        self.groups = {}
+
+    def add(self, alerts, now):
+        """
+        alerts: every (rule, node_id, message, timestamp) firing this cycle.
+        Pairs missing from it are treated as resolved and may notify again.
+        Returns how many alerts were new.
+        """
+        firing = {(a[0], a[1]) for a in alerts}
+        for key in [k for k in self.last_notified if k not in firing]:
+            del self.last_notified[key]
+
+        added = 0
+        for rule, node_id, message, ts in alerts:
+            key = (rule, node_id)
+            last = self.last_notified.get(key)
+            if last is not None and now - last < self.repeat_interval:
+                continue
+            self.last_notified[key] = now
+
+            group = self.groups.get(rule)
+            if group is None:
+                group = self.groups[rule] = {"rule": rule, "opened": now, "alerts": []}
+            group["alerts"].append({"node_id": node_id, "message": message, "timestamp": ts})
+            added += 1
+        return added
+
+    def ready(self, now):
+        # Groups whose window has elapsed; they stay queued until ack()
+        return [summarize(g) for g in self.groups.values() if now - g["opened"] >= self.group_wait]
+
+    def ack(self, notifications, now):
+        # Called once the notifications are persisted, so a failed write is retried
+        for n in notifications:
+            self.groups.pop(n["rule"], None)
+
+        expired = [k for k, t in self.last_notified.items() if now - t >= self.repeat_interval]
+        for key in expired:
+            del self.last_notified[key]
+
+
+def summarize(group):
+    alerts = group["alerts"]
+    nodes = sorted({a["node_id"] for a in alerts})
+    if len(alerts) == 1:
+        title = alerts[0]["message"]
+        node_id = alerts[0]["node_id"]
+    else:
+        shown = ", ".join(nodes[:MAX_NODES_IN_MESSAGE])
+        more = f" (+{len(nodes) - MAX_NODES_IN_MESSAGE} more)" if len(nodes) > MAX_NODES_IN_MESSAGE else ""
+        title = f"{group['rule']}: {len(alerts)} alerts on {len(nodes)} nodes: {shown}{more}"
+        # alerts.node_id only ever holds a real node; the full list is in "nodes"
+        node_id = nodes[0] if len(nodes) == 1 else None
+    return {
+        "rule": group["rule"],
+        "title": title,
+        "node_id": node_id,
+        "nodes": nodes,
+        "count": len(alerts),
+        "first": min(a["timestamp"] for a in alerts),
+        "last": max(a["timestamp"] for a in alerts),
+        "alerts": alerts,
+    }
+
+
+# ================= SINKS =================
+class Sink:
+    name = "sink"
+
+    def __init__(self, rate_per_min=NOTIFY_RATE_PER_MIN):
+        self.rate_per_min = rate_per_min
+
+    def send(self, notification):
+        raise NotImplementedError
+
+
+class WebhookSink(Sink):
+    name = "webhook"
+
+    def __init__(self, url, **kwargs):
+        super().__init__(**kwargs)
+        self.url = url
+        self.session = requests.Session()
+
+    def send(self, notification):
+        resp = self.session.post(self.url, data=json.dumps(notification, default=str),
+                                 headers={"Content-Type": "application/json"}, timeout=NOTIFY_TIMEOUT)
+        resp.raise_for_status()
+
+
+class SmtpSink(Sink):
+    name = "smtp"
+
+    def __init__(self, host, port, sender, recipients, **kwargs):
+        super().__init__(**kwargs)
+        self.host = host
+        self.port = port
+        self.sender = sender
+        self.recipients = recipients
+
+    def send(self, notification):
+        msg = EmailMessage()
+        msg["Subject"] = f"[NodeSense] {notification['title']}"[:200]
+        msg["From"] = self.sender
+        msg["To"] = ", ".join(self.recipients)
+        msg.set_content("\n".join(
+            f"{a['timestamp']}  {a['message']}" for a in notification["alerts"]
+        ))
+        with smtplib.SMTP(self.host, self.port, timeout=NOTIFY_TIMEOUT) as smtp:
+            smtp.send_message(msg)
+
+
+class FileSink(Sink):
+    name = "file"
+
+    def __init__(self, path, **kwargs):
+        super().__init__(**kwargs)
+        self.path = path
+        self._lock = threading.Lock()
+
+    def send(self, notification):
+        line = json.dumps(notification, default=str)
+        with self._lock, open(self.path, "a") as f:
+            f.write(line + "\n")
+
+
+def sinks_from_env():
+    sinks = []
+    if os.getenv("NOTIFY_WEBHOOK_URL"):
+        sinks.append(WebhookSink(os.getenv("NOTIFY_WEBHOOK_URL")))
+    if os.getenv("NOTIFY_SMTP_HOST"):
+        sinks.append(SmtpSink(
+            os.getenv("NOTIFY_SMTP_HOST"),
+            int(os.getenv("NOTIFY_SMTP_PORT", "25")),
+            os.getenv("NOTIFY_SMTP_FROM", "nodesense@localhost"),
+            [r.strip() for r in os.getenv("NOTIFY_SMTP_TO", "").split(",") if r.strip()],
+        ))
+    if os.getenv("NOTIFY_FILE"):
+        sinks.append(FileSink(os.getenv("NOTIFY_FILE")))
+    return sinks
+
+
+# ================= DELIVERY =================
+class TokenBucket:
+    def __init__(self, rate_per_min, burst=None):
+        self.rate = rate_per_min / 60.0
+        self.capacity = burst or max(rate_per_min / 6.0, 1.0)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+
+    def take(self, now):
+        """Returns 0 if a token was taken, else seconds until one is available."""
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return 0.0
+        return (1 - self.tokens) / self.rate
+
+
+class Dispatcher:
+    """
+    Delivers notifications to every sink asynchronously: a scheduler thread
+    hands due jobs to a bounded worker pool, applying per-sink rate limits
+    and re-queueing failed deliveries with exponential backoff.
+    """
+
+    def __init__(self, sinks, workers=NOTIFY_WORKERS, max_retries=NOTIFY_MAX_RETRIES,
+                 backoff=NOTIFY_RETRY_BACKOFF):
+        self.sinks = sinks
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.buckets = {id(s): TokenBucket(s.rate_per_min) for s in sinks}
+        self.pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="notify")
+        self.queue = []
+        self.seq = itertools.count()
+        self.cond = threading.Condition()
+        self.stopped = False
+        self.thread = threading.Thread(target=self._schedule, name="notify-scheduler", daemon=True)
+        self.thread.start()
+
+    def submit(self, notification):
+        now = time.monotonic()
+        with self.cond:
+            for sink in self.sinks:
+                heapq.heappush(self.queue, (now, next(self.seq), sink, notification, 0))
+            self.cond.notify()
+
+    def _push(self, due, sink, notification, attempt):
+        with self.cond:
+            heapq.heappush(self.queue, (due, next(self.seq), sink, notification, attempt))
+            self.cond.notify()
+
+    def _schedule(self):
+        while True:
+            with self.cond:
+                while not self.stopped and (not self.queue or self.queue[0][0] > time.monotonic()):
+                    timeout = self.queue[0][0] - time.monotonic() if self.queue else None
+                    self.cond.wait(timeout)
+                if self.stopped:
+                    return
+                due, _, sink, notification, attempt = heapq.heappop(self.queue)
+
+            now = time.monotonic()
+            wait = self.buckets[id(sink)].take(now)
+            if wait:
+                # Rate limited: try again when the sink has capacity, not a failed attempt
+                self._push(now + wait, sink, notification, attempt)
+                continue
+            self.pool.submit(self._deliver, sink, notification, attempt)
+
+    def _deliver(self, sink, notification, attempt):
+        try:
+            sink.send(notification)
+            logging.info(f"Notified {sink.name}: {notification['title']}")
+        except Exception as e:
+            if attempt + 1 >= self.max_retries:
+                logging.error(f"Giving up on {sink.name} notification after {attempt + 1} attempts: {e}")
+                return
+            delay = self.backoff * (2 ** attempt)
+            logging.warning(f"{sink.name} notification failed ({e}), retrying in {delay:.1f}s")
+            self._push(time.monotonic() + delay, sink, notification, attempt + 1)
+
+    def pending(self):
+        with self.cond:
+            return len(self.queue)
+
+    def close(self):
+        with self.cond:
+            self.stopped = True
+            self.cond.notify()
+        self.thread.join()
+        self.pool.shutdown(wait=True)
@@ -1,73 +1,280 @@
-from fastapi import FastAPI, HTTPException
-from models import IngestPayload
+from fastapi import FastAPI, HTTPException, Request, Response, Query
+from fastapi.exceptions import RequestValidationError
+from pydantic import ValidationError
+from models import IngestPayload, SummaryPayload, ContainerPayload
+import os
+import json
+import math
+import time
+import base64
 import asyncio
-from db import get_pool, upsert_node, insert_metrics, get_all_nodes, delete_node, delete_all_nodes, trigger_db_error
-from prometheus_client import make_asgi_app, Gauge
+import asyncpg
+import logging
+from datetime import datetime, timedelta, timezone
+from typing import List
+from db import (
+    LAST_SEEN_FLUSH_INTERVAL, get_pool, ensure_node, mark_seen, forget_node, flush_last_seen, last_seen_flusher,
+    insert_metrics, insert_summaries, ensure_containers, insert_container_metrics, NODE_FIELDS, list_nodes, get_series, trigger_db_error,
+)
+import cache
+import jobs
+from tracing import stage, observe_lag, trace_id, log_sampled
+import profiler
+import socket
+from prometheus_client import make_asgi_app, Gauge, CollectorRegistry, multiprocess
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 
 app = FastAPI()
 
-# Prometheus Metrics
-metrics_app = make_asgi_app()
+# Prometheus Metrics (aggregated across workers when running under gunicorn)
+if os.getenv("PROMETHEUS_MULTIPROC_DIR"):
+    _registry = CollectorRegistry()
+    multiprocess.MultiProcessCollector(_registry)
+    metrics_app = make_asgi_app(registry=_registry)
+else:
+    metrics_app = make_asgi_app()
 app.mount("/metrics", metrics_app)
 
-NODE_METRIC = Gauge("node_metric", "Metric value from node", ["node_id", "name", "unit"])
-NODE_LAST_SEEN = Gauge("node_last_seen", "Last seen timestamp of the node", ["node_id"])
+# Any worker may receive a node's sample, so report the most recent write
+NODE_METRIC = Gauge("node_metric", "Metric value from node", ["node_id", "name", "unit"], multiprocess_mode="mostrecent")
+NODE_METRIC_WINDOW_MAX = Gauge("node_metric_window_max", "Max metric value in the last summary window", ["node_id", "name", "unit"], multiprocess_mode="mostrecent")
+CONTAINER_METRIC = Gauge("container_metric", "Metric value from container", ["node_id", "container", "name", "unit"], multiprocess_mode="mostrecent")
+NODE_LAST_SEEN = Gauge("node_last_seen", "Last seen timestamp of the node", ["node_id"], multiprocess_mode="max")
+
+# Bounds on /series so a single query stays cheap to compute and cache
+SERIES_MIN_BUCKET = int(os.getenv("SERIES_MIN_BUCKET", "10"))
+SERIES_MAX_BUCKETS = int(os.getenv("SERIES_MAX_BUCKETS", "1440"))
+
+# Node listing: page size bounds and liveness thresholds for the status filter
+NODES_PAGE_DEFAULT = int(os.getenv("NODES_PAGE_DEFAULT", "100"))
+NODES_PAGE_MAX = int(os.getenv("NODES_PAGE_MAX", "1000"))
+# Longest gap between two reports from a healthy agent: summary mode sends every
+# FLUSH_INTERVAL (60s), adaptive sampling backs off to MAX_INTERVAL (30s)
+AGENT_REPORT_INTERVAL = float(os.getenv("AGENT_REPORT_INTERVAL", "60"))
+# A node is stale once a report is overdue (plus last_seen write-back and
+# half an interval of slack), and down after the same 2 minutes alerting uses
+NODE_STALE_AFTER = float(os.getenv(
+    "NODE_STALE_AFTER", str(AGENT_REPORT_INTERVAL * 1.5 + LAST_SEEN_FLUSH_INTERVAL)
+))
+NODE_DOWN_AFTER = max(float(os.getenv("NODE_DOWN_AFTER", "120")), NODE_STALE_AFTER)
+
+_flusher_task = None
+_jobs_task = None
 
 
 @app.on_event("startup")
 async def startup_event():
+    # Under gunicorn the master already ran this once before forking workers
+    if not os.getenv("STARTUP_INIT_DONE"):
+        try:
+            from db import init_schema
+            pool = await get_pool()
+            async with pool.acquire() as conn:
+                await init_schema(conn)
+        except Exception as e:
+            print(f"Startup DB init failed: {e}")
+
+    global _flusher_task, _jobs_task
+    _flusher_task = asyncio.create_task(last_seen_flusher())
+    _jobs_task = asyncio.create_task(jobs.job_runner())
+
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    if _flusher_task:
+        _flusher_task.cancel()
+    if _jobs_task:
+        _jobs_task.cancel()
     try:
-        from db import init_alerts_table
         pool = await get_pool()
         async with pool.acquire() as conn:
-            await init_alerts_table(conn)
+            await flush_last_seen(conn)
     except Exception as e:
-        print(f"Startup DB init failed: {e}")
+        print(f"Final last_seen flush failed: {e}")
 
 @app.get("/health")
 async def health():
     return {"status": "ok"}
 
 
+async def query(fn, *args):
+    pool = await get_pool()
+    async with pool.acquire() as conn:
+        return await fn(conn, *args)
+
+
+def encode_cursor(order, node):
+    key = [node["id"]] if order == "id" else [node["last_seen"].isoformat(), node["id"]]
+    return base64.urlsafe_b64encode(json.dumps([order] + key).encode()).decode().rstrip("=")
+
+
+def decode_cursor(order, cursor):
+    try:
+        decoded = json.loads(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)))
+        if decoded[0] != order:
+            raise ValueError("cursor was issued for a different order")
+        if order == "id":
+            return (str(decoded[1]),)
+        return (datetime.fromisoformat(decoded[1]), str(decoded[2]))
+    except Exception:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+
+def node_status(last_seen, now):
+    age = (now - last_seen).total_seconds()
+    if age < NODE_STALE_AFTER:
+        return "up"
+    return "stale" if age < NODE_DOWN_AFTER else "down"
+
+
 @app.get("/nodes")
-async def get_nodes():
+async def get_nodes(
+    limit: int = NODES_PAGE_DEFAULT,
+    cursor: str = None,
+    order: str = "last_seen",
+    status: str = None,
+    name_prefix: str = None,
+    label: List[str] = Query(None),
+    fields: str = None,
+):
+    if not 1 <= limit <= NODES_PAGE_MAX:
+        raise HTTPException(status_code=400, detail=f"limit must be between 1 and {NODES_PAGE_MAX}")
+    if order not in ("last_seen", "id"):
+        raise HTTPException(status_code=400, detail="order must be 'last_seen' or 'id'")
+    if status not in (None, "up", "stale", "down"):
+        raise HTTPException(status_code=400, detail="status must be 'up', 'stale' or 'down'")
+
+    # label=env:prod (repeatable) matches nodes whose labels contain every pair
+    labels = {}
+    for item in label or []:
+        key, sep, value = item.partition(":")
+        if not sep or not key:
+            raise HTTPException(status_code=400, detail="label must be given as key:value")
+        labels[key] = value
+
+    selected = list(NODE_FIELDS) + ["status"]
+    if fields:
+        selected = [f.strip() for f in fields.split(",") if f.strip()]
+        unknown = set(selected) - set(NODE_FIELDS) - {"status"}
+        if unknown:
+            raise HTTPException(status_code=400, detail=f"Unknown fields: {', '.join(sorted(unknown))}")
+
+    after = decode_cursor(order, cursor) if cursor else None
+    params = {
+        "limit": limit, "cursor": cursor, "order": order, "status": status,
+        "name_prefix": name_prefix or None, "labels": labels or None, "fields": selected,
+    }
+
+    async def load():
+        now = datetime.now(timezone.utc)
+        stale, down = now - timedelta(seconds=NODE_STALE_AFTER), now - timedelta(seconds=NODE_DOWN_AFTER)
+        seen_after, seen_before = {
+            None: (None, None), "up": (stale, None), "stale": (down, stale), "down": (None, down),
+        }[status]
+        rows = await query(list_nodes, limit, order, after, seen_after, seen_before, name_prefix, labels)
+
+        page = rows[:limit]
+        for node in page:
+            node["status"] = node_status(node["last_seen"], now)
+        return {
+            "items": [{f: node[f] for f in selected} for node in page],
+            "next_cursor": encode_cursor(order, page[-1]) if len(rows) > limit else None,
+        }
+
     try:
-        pool = await get_pool()
-        async with pool.acquire() as conn:
-            nodes = await get_all_nodes(conn)
-        return nodes
+        body = await cache.read_through("nodes", params, cache.NODES_TTL, load)
+        return Response(content=body, media_type="application/json")
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 
-@app.delete("/nodes/{node_id}")
+@app.get("/series")
+async def get_series_endpoint(metric: str, node_id: str = None, bucket: int = 60, window: int = 3600, until: float = None):
+    if bucket < SERIES_MIN_BUCKET:
+        raise HTTPException(status_code=400, detail=f"bucket must be at least {SERIES_MIN_BUCKET}s")
+    if window <= 0 or window / bucket > SERIES_MAX_BUCKETS:
+        raise HTTPException(status_code=400, detail=f"window must cover 1 to {SERIES_MAX_BUCKETS} buckets")
+
+    # Align the range to bucket boundaries so viewers asking for "the last hour"
+    # within the same bucket share one cache entry
+    now = time.time()
+    end = math.ceil(min(until or now, now) / bucket) * bucket
+    start = end - math.ceil(window / bucket) * bucket
+    # Closed buckets are cached for long, the still-filling tail briefly
+    split = min(max(cache.closed_before(bucket, now), start), end)
+
+    def part(lo, hi, ttl):
+        if lo >= hi:
+            return b"[]"
+        params = {"metric": metric, "node_id": node_id, "bucket": bucket, "start": lo, "end": hi}
+        return cache.read_through("series", params, ttl, lambda: query(
+            get_series, metric, node_id, bucket,
+            datetime.fromtimestamp(lo, timezone.utc), datetime.fromtimestamp(hi, timezone.utc),
+        ))
+
+    try:
+        closed = await part(start, split, cache.CLOSED_TTL)
+        recent = await part(split, end, cache.OPEN_TTL)
+        return Response(content=cache.concat(closed, recent), media_type="application/json")
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+@app.delete("/nodes/{node_id}", status_code=202)
 async def delete_node_endpoint(node_id: str):
+    # The node is hidden now; its data is purged in the background
     try:
         pool = await get_pool()
         async with pool.acquire() as conn:
-            deleted_count = await delete_node(conn, node_id)
-        
-        if deleted_count == 0:
+            job = await jobs.enqueue_deletion(conn, node_id)
+        forget_node(node_id)
+
+        if job is None:
             raise HTTPException(status_code=404, detail=f"Node {node_id} not found")
 
-        return {"status": "deleted", "id": node_id}
+        await cache.invalidate()
+        return {"status": "deleting", "id": node_id, "job_id": job["id"]}
     except HTTPException:
         raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 
-@app.delete("/nodes")
+@app.delete("/nodes", status_code=202)
 async def delete_all_nodes_endpoint():
     try:
         pool = await get_pool()
         async with pool.acquire() as conn:
-            await delete_all_nodes(conn)
-        return {"status": "all deleted"}
+            job = await jobs.enqueue_deletion(conn)
+        forget_node()
+        await cache.invalidate()
+        if job is None:
+            return {"status": "deleting", "nodes": 0, "job_id": None}
+        return {"status": "deleting", "nodes": job["nodes"], "job_id": job["id"]}
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+@app.get("/jobs")
+async def list_jobs_endpoint(limit: int = 20):
+    try:
+        return await query(jobs.list_jobs, min(max(limit, 1), 100))
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 
+@app.get("/jobs/{job_id}")
+async def get_job_endpoint(job_id: int):
+    try:
+        job = await query(jobs.get_job, job_id)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"Job {job_id} not found")
+    return job
+
+
 @app.post("/debug/db-error")
 async def debug_db_error():
     try:
@@ -80,8 +287,50 @@ async def debug_db_error():
         raise HTTPException(status_code=500, detail=str(e))
 
 
+@app.get("/debug/profile")
+async def debug_profile(seconds: float = 10, format: str = "speedscope", top: int = 20):
+    if format not in ("speedscope", "collapsed"):
+        raise HTTPException(status_code=400, detail="format must be 'speedscope' or 'collapsed'")
+    try:
+        return await profiler.capture(seconds, fmt=format, top=top, name=f"collector@{socket.gethostname()}:{os.getpid()}")
+    except profiler.ProfilerBusy:
+        raise HTTPException(status_code=409, detail="A profile is already being captured in this worker")
+
+
+async def parse_payload(request: Request, model):
+    # Validate by hand (rather than as a handler parameter) so it can be timed
+    body = await request.body()
+    with stage("validate"):
+        try:
+            return model.model_validate_json(body)
+        except ValidationError as e:
+            raise RequestValidationError(e.errors())
+
+
+async def write_for_node(node_id: str, write, labels=None):
+    pool = await get_pool()
+    with stage("pool_acquire"):
+        conn = await pool.acquire()
+    try:
+        await ensure_node(conn, node_id, labels)
+        with stage("db_insert"):
+            try:
+                await write(conn)
+            except asyncpg.ForeignKeyViolationError:
+                # Node was deleted (possibly by another replica) since we cached it
+                forget_node(node_id)
+                await ensure_node(conn, node_id, labels)
+                await write(conn)
+    finally:
+        await pool.release(conn)
+    mark_seen(node_id)
+
+
 @app.post("/ingest")
-async def ingest(payload: IngestPayload):
+async def ingest(request: Request):
+    payload = await parse_payload(request, IngestPayload)
+    observe_lag("sample", payload.timestamp)
+
     # Update Prometheus metrics
     NODE_LAST_SEEN.labels(node_id=payload.node_id).set_to_current_time()
     
@@ -93,14 +342,73 @@ async def ingest(payload: IngestPayload):
         ).set(m.value)
 
     try:
-        pool = await get_pool()
-        async with pool.acquire() as conn:
-            async with conn.transaction():
-                await upsert_node(conn, payload.node_id)
-                await insert_metrics(
-                    conn, payload.node_id, payload.timestamp, payload.metrics
-                )
+        await write_for_node(
+            payload.node_id,
+            lambda conn: insert_metrics(conn, payload.node_id, payload.timestamp, payload.metrics),
+            payload.labels,
+        )
+        log_sampled("ingest node=%s metrics=%d trace=%s", payload.node_id, len(payload.metrics), trace_id(request))
+        return {"status": "ok"}
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
 
+
+@app.post("/ingest/summary")
+async def ingest_summary(request: Request):
+    payload = await parse_payload(request, SummaryPayload)
+    observe_lag("summary", payload.window_end)
+
+    NODE_LAST_SEEN.labels(node_id=payload.node_id).set_to_current_time()
+
+    for s in payload.summaries:
+        NODE_METRIC.labels(
+            node_id=payload.node_id,
+            name=s.name,
+            unit=s.unit or ""
+        ).set(s.last)
+        NODE_METRIC_WINDOW_MAX.labels(
+            node_id=payload.node_id,
+            name=s.name,
+            unit=s.unit or ""
+        ).set(s.max)
+
+    try:
+        await write_for_node(
+            payload.node_id,
+            lambda conn: insert_summaries(
+                conn, payload.node_id, payload.window_start, payload.window_end, payload.summaries
+            ),
+            payload.labels,
+        )
+        log_sampled("summary node=%s summaries=%d trace=%s", payload.node_id, len(payload.summaries), trace_id(request))
+        return {"status": "ok"}
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+@app.post("/ingest/containers")
+async def ingest_containers(request: Request):
+    payload = await parse_payload(request, ContainerPayload)
+    observe_lag("containers", payload.timestamp)
+
+    NODE_LAST_SEEN.labels(node_id=payload.node_id).set_to_current_time()
+
+    for c in payload.containers:
+        for m in c.metrics:
+            CONTAINER_METRIC.labels(
+                node_id=payload.node_id,
+                container=c.name,
+                name=m.name,
+                unit=m.unit or ""
+            ).set(m.value)
+
+    async def write(conn):
+        await ensure_containers(conn, payload.node_id, payload.containers)
+        await insert_container_metrics(conn, payload.timestamp, payload.containers)
+
+    try:
+        await write_for_node(payload.node_id, write)
+        log_sampled("containers node=%s containers=%d trace=%s", payload.node_id, len(payload.containers), trace_id(request))
         return {"status": "ok"}
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
@@ -0,0 +1,165 @@
+import os
+import json
+import math
+import time
+import asyncio
+import hashlib
+import logging
+from datetime import date, datetime
+from decimal import Decimal
+
+import redis.asyncio as redis
+from prometheus_client import Counter
+
+REDIS_URL = os.getenv("REDIS_URL", "redis://redis:6379")
+QUERY_CACHE = os.getenv("QUERY_CACHE", "true").lower() in ("1", "true", "yes")
+
+# Buckets that can still receive samples are cached briefly, closed ones for long
+OPEN_TTL = float(os.getenv("QUERY_CACHE_OPEN_TTL", "5"))
+CLOSED_TTL = float(os.getenv("QUERY_CACHE_CLOSED_TTL", "3600"))
+# A bucket only counts as closed this long after it ends: summaries are stamped
+# with their window start and land up to FLUSH_INTERVAL (60s) later, plus skew
+CLOSED_GRACE = float(os.getenv("QUERY_CACHE_CLOSED_GRACE", "120"))
+NODES_TTL = float(os.getenv("QUERY_CACHE_NODES_TTL", "2"))
+# How long a miss holds the cross-replica fill lock, and how long others wait on it
+LOCK_TTL = float(os.getenv("QUERY_CACHE_LOCK_TTL", "5"))
+LOCK_WAIT = float(os.getenv("QUERY_CACHE_LOCK_WAIT", "2"))
+# After a Redis error, serve straight from the database for this long
+ERROR_BACKOFF = float(os.getenv("QUERY_CACHE_ERROR_BACKOFF", "10"))
+
+GENERATION_KEY = "qc:gen"
+
+logger = logging.getLogger("collector")
+
+CACHE_REQUESTS = Counter(
+    "collector_query_cache_total",
+    "Read-through cache lookups by endpoint and result",
+    ["endpoint", "result"],
+)
+
+_redis = None
+_inflight = {}
+_disabled_until = 0.0
+
+
+def get_redis():
+    # Created lazily so each worker gets its own connection pool
+    global _redis
+    if _redis is None:
+        _redis = redis.from_url(REDIS_URL)
+    return _redis
+
+
+def _json_default(o):
+    if isinstance(o, (datetime, date)):
+        return o.isoformat()
+    if isinstance(o, Decimal):
+        return float(o)
+    raise TypeError(f"Object of type {type(o).__name__} is not JSON serializable")
+
+
+def dumps(value):
+    return json.dumps(value, default=_json_default, separators=(",", ":")).encode()
+
+
+def cache_key(name, params, generation):
+    # Same query in any parameter order (or with defaults spelled out) hits the same entry
+    normalized = json.dumps(
+        {k: v for k, v in params.items() if v is not None}, sort_keys=True, default=str
+    )
+    digest = hashlib.sha1(normalized.encode()).hexdigest()
+    return f"qc:{name}:{generation}:{digest}"
+
+
+async def invalidate():
+    # Deletions bump the generation, orphaning every cached entry at once
+    if not QUERY_CACHE:
+        return
+    try:
+        await get_redis().incr(GENERATION_KEY)
+    except Exception as e:
+        logger.warning(f"Query cache invalidation failed: {e}")
+
+
+def closed_before(bucket, now=None):
+    # Start of the oldest bucket that may still receive rows
+    now = time.time() if now is None else now
+    return math.floor((now - CLOSED_GRACE) / bucket) * bucket
+
+
+def concat(first, second):
+    # Join two cached JSON arrays without decoding them
+    if first == b"[]":
+        return second
+    if second == b"[]":
+        return first
+    return first[:-1] + b"," + second[1:]
+
+
+async def read_through(name, params, ttl, loader):
+    """
+    Returns the JSON-encoded result of `loader()` for this query, from Redis
+    when possible. Concurrent misses for the same key are collapsed: within a
+    worker they share one in-flight load, across workers and replicas only
+    the holder of a short Redis lock queries the database while the rest wait
+    for its result. Redis problems fall back to querying directly.
+    """
+    global _disabled_until
+
+    if not QUERY_CACHE or time.monotonic() < _disabled_until:
+        CACHE_REQUESTS.labels(endpoint=name, result="bypass").inc()
+        return dumps(await loader())
+
+    try:
+        r = get_redis()
+        generation = int(await r.get(GENERATION_KEY) or 0)
+        key = cache_key(name, params, generation)
+        cached = await r.get(key)
+    except Exception as e:
+        logger.warning(f"Query cache unavailable, reading from database: {e}")
+        _disabled_until = time.monotonic() + ERROR_BACKOFF
+        CACHE_REQUESTS.labels(endpoint=name, result="error").inc()
+        return dumps(await loader())
+
+    if cached is not None:
+        CACHE_REQUESTS.labels(endpoint=name, result="hit").inc()
+        return cached
+
+    task = _inflight.get(key)
+    if task is None:
+        task = _inflight[key] = asyncio.ensure_future(_fill(r, name, key, ttl, loader))
+        task.add_done_callback(lambda _: _inflight.pop(key, None))
+    else:
+        CACHE_REQUESTS.labels(endpoint=name, result="coalesced").inc()
+    return await asyncio.shield(task)
+
+
+async def _fill(r, name, key, ttl, loader):
+    lock = f"{key}:lock"
+    try:
+        owner = await r.set(lock, b"1", nx=True, px=int(LOCK_TTL * 1000))
+    except Exception:
+        owner = True
+
+    if not owner:
+        # Another worker or replica is already running this query
+        deadline = time.monotonic() + LOCK_WAIT
+        while time.monotonic() < deadline:
+            await asyncio.sleep(0.05)
+            try:
+                cached = await r.get(key)
+            except Exception:
+                break
+            if cached is not None:
+                CACHE_REQUESTS.labels(endpoint=name, result="coalesced").inc()
+                return cached
+
+    CACHE_REQUESTS.labels(endpoint=name, result="miss").inc()
+    value = dumps(await loader())
+    try:
+        await r.set(key, value, px=int(ttl * 1000))
+        if owner:
+            await r.delete(lock)
+    except Exception as e:
+        logger.warning(f"Query cache write failed: {e}")
+    return value
@@ -1,39 +1,127 @@
 import asyncpg
+import asyncio
+import json
 import os
+from datetime import datetime, timedelta, timezone
 
 DB_HOST = os.getenv("DB_HOST", "timescaledb")
 DB_NAME = os.getenv("DB_NAME", "nodesense")
 DB_USER = os.getenv("DB_USER", "nodesense")
 DB_PASS = os.getenv("DB_PASS", "nodesensepass")
+DB_POOL_MAX = int(os.getenv("DB_POOL_MAX", "10"))
+LAST_SEEN_FLUSH_INTERVAL = float(os.getenv("LAST_SEEN_FLUSH_INTERVAL", "5"))
 
+# One pool per worker process, created lazily inside that worker's event loop
 _pool = None
+_pool_lock = asyncio.Lock()
+
+# Node liveness is tracked in memory and written back in batches, so the hot
+# `nodes` table is only touched synchronously the first time a node is seen.
+_known_nodes = {}  # node_id -> labels last written (None if never sent)
+_pending_last_seen = {}
+_known_containers = set()
 
 
 async def get_pool():
     global _pool
 
     if _pool is None:
-        _pool = await asyncpg.create_pool(
-            host=DB_HOST,
-            database=DB_NAME,
-            user=DB_USER,
-            password=DB_PASS,
-            min_size=1,
-            max_size=10,
-        )
+        async with _pool_lock:
+            if _pool is None:
+                _pool = await asyncpg.create_pool(
+                    host=DB_HOST,
+                    database=DB_NAME,
+                    user=DB_USER,
+                    password=DB_PASS,
+                    min_size=1,
+                    max_size=DB_POOL_MAX,
+                )
     return _pool
 
 
-async def upsert_node(conn, node_id: str):
+async def run_startup_init():
+    # One-off schema setup; uses its own connection so no pool outlives it
+    conn = await asyncpg.connect(host=DB_HOST, database=DB_NAME, user=DB_USER, password=DB_PASS)
+    try:
+        await init_schema(conn)
+    finally:
+        await conn.close()
+
+
+async def ensure_node(conn, node_id: str, labels=None):
+    # Only the first sample from a node (or one carrying new labels) touches the row
+    if node_id in _known_nodes and (labels is None or _known_nodes[node_id] == labels):
+        return
+
     await conn.execute(
         """
-        INSERT INTO nodes (id, name)
-        VALUES ($1, $1)
-        ON CONFLICT (id) DO UPDATE
-            SET last_seen = now()
+        INSERT INTO nodes (id, name, labels)
+        VALUES ($1, $1, $2::jsonb)
+        ON CONFLICT (id) DO UPDATE SET labels = EXCLUDED.labels
+        WHERE EXCLUDED.labels IS NOT NULL AND nodes.labels IS DISTINCT FROM EXCLUDED.labels
         """,
         node_id,
+        json.dumps(labels) if labels is not None else None,
     )
+    _known_nodes[node_id] = labels if labels is not None else _known_nodes.get(node_id)
+
+
+def forget_node(node_id: str = None):
+    # Drop cached knowledge of a node (or all nodes) after deletion
+    if node_id is None:
+        _known_nodes.clear()
+        _pending_last_seen.clear()
+    else:
+        _known_nodes.pop(node_id, None)
+        _pending_last_seen.pop(node_id, None)
+    # Container rows cascade with their node; re-register lazily
+    _known_containers.clear()
+
+
+def mark_seen(node_id: str):
+    _pending_last_seen[node_id] = datetime.now(timezone.utc)
+
+
+async def flush_last_seen(conn):
+    global _pending_last_seen
+
+    if not _pending_last_seen:
+        return 0
+
+    pending, _pending_last_seen = _pending_last_seen, {}
+    # Sorted ids give every replica the same lock order
+    ids = sorted(pending)
+    stamps = [pending[i] for i in ids]
+
+    try:
+        await conn.execute(
+            """
+            UPDATE nodes AS n
+            SET last_seen = v.last_seen
+            FROM unnest($1::text[], $2::timestamptz[]) AS v(id, last_seen)
+            WHERE n.id = v.id
+              AND (n.last_seen IS NULL OR n.last_seen < v.last_seen)
+            """,
+            ids,
+            stamps,
+        )
+    except Exception:
+        # Put the batch back unless newer values arrived meanwhile
+        for node_id, ts in pending.items():
+            _pending_last_seen.setdefault(node_id, ts)
+        raise
+    return len(ids)
+
+
+async def last_seen_flusher():
+    while True:
+        await asyncio.sleep(LAST_SEEN_FLUSH_INTERVAL)
+        try:
+            pool = await get_pool()
+            async with pool.acquire() as conn:
+                await flush_last_seen(conn)
+        except Exception as e:
+            print(f"last_seen flush failed: {e}")
 
 
 async def insert_metrics(conn, node_id: str, timestamp, metrics):
@@ -47,23 +135,223 @@ async def insert_metrics(conn, node_id: str, timestamp, metrics):
         rows,
     )
 
-async def get_all_nodes(conn):
-    rows = await conn.fetch("SELECT id, name, last_seen FROM nodes ORDER BY last_seen DESC")
-    return [{"id": r["id"], "name": r["name"], "last_seen": r["last_seen"]} for r in rows]
+async def insert_summaries(conn, node_id: str, window_start, window_end, summaries):
+    rows = [
+        (
+            window_start, window_end, node_id, s.name, s.unit,
+            s.count, s.min, s.max, s.sum, s.last,
+            json.dumps(s.percentiles) if s.percentiles else None,
+        )
+        for s in summaries
+    ]
 
+    await conn.executemany(
+        """
+        INSERT INTO metric_summaries
+            (time, window_end, node_id, metric_name, unit, count, min, max, sum, last, percentiles)
+        VALUES ($1, $2, $3, $4, $5, $6, $7, $8, $9, $10, $11::jsonb)
+        """,
+        rows,
+    )
 
-async def delete_node(conn, node_id: str):
-    result = await conn.execute("DELETE FROM nodes WHERE id = $1", node_id)
-    # result is string like "DELETE 1"
-    try:
-        count = int(result.split(" ")[1])
-        return count
-    except:
-        return 0
+async def ensure_containers(conn, node_id: str, containers):
+    # Register only containers this replica has not seen yet
+    new = [c for c in containers if c.id not in _known_containers]
+    if not new:
+        return
+
+    await conn.executemany(
+        """
+        INSERT INTO containers (id, node_id, name, labels)
+        VALUES ($1, $2, $3, $4::jsonb)
+        ON CONFLICT (id) DO UPDATE
+            SET node_id = EXCLUDED.node_id, name = EXCLUDED.name, labels = EXCLUDED.labels
+        """,
+        [(c.id, node_id, c.name, json.dumps(c.labels)) for c in new],
+    )
+    _known_containers.update(c.id for c in new)
 
 
-async def delete_all_nodes(conn):
-    await conn.execute("DELETE FROM nodes")
+async def insert_container_metrics(conn, timestamp, containers):
+    records = [
+        (timestamp, c.id, m.name, m.value, m.unit)
+        for c in containers
+        for m in c.metrics
+    ]
+    if not records:
+        return
+
+    # COPY keeps hundreds of rows per payload to a single round trip
+    await conn.copy_records_to_table(
+        "container_metrics",
+        records=records,
+        columns=["time", "container_id", "metric_name", "value", "unit"],
+    )
+
+NODE_FIELDS = ("id", "name", "labels", "last_seen")
+
+
+def prefix_upper_bound(prefix: str):
+    # Smallest string greater than every string starting with `prefix` (byte order)
+    while prefix:
+        last = ord(prefix[-1])
+        if last < 0x10FFFF:
+            # Skip surrogates, which can't be encoded
+            return prefix[:-1] + chr(0xE000 if 0xD7FF <= last < 0xE000 else last + 1)
+        prefix = prefix[:-1]
+    return None
+
+
+async def list_nodes(conn, limit: int, order: str = "last_seen", after=None,
+                     seen_after=None, seen_before=None, name_prefix=None, labels=None):
+    """
+    One page of nodes in keyset order: (last_seen DESC, id DESC) or (id ASC).
+    `after` is the sort key of the previous page's last row. Fetches one
+    extra row so the caller can tell whether another page follows.
+    """
+    # Nodes pending deletion are hidden right away
+    conditions, args = ["deleted_at IS NULL"], []
+
+    def arg(value):
+        args.append(value)
+        return f"${len(args)}"
+
+    if after is not None:
+        if order == "id":
+            conditions.append(f"id > {arg(after[0])}")
+        else:
+            conditions.append(f"(last_seen, id) < ({arg(after[0])}::timestamptz, {arg(after[1])})")
+    if seen_after is not None:
+        conditions.append(f"last_seen >= {arg(seen_after)}")
+    if seen_before is not None:
+        conditions.append(f"last_seen < {arg(seen_before)}")
+    if name_prefix:
+        # Range on the C-collated index instead of LIKE, which a generic plan can't index
+        conditions.append(f'name COLLATE "C" >= {arg(name_prefix)}')
+        upper = prefix_upper_bound(name_prefix)
+        if upper is not None:
+            conditions.append(f'name COLLATE "C" < {arg(upper)}')
+    if labels:
+        conditions.append(f"labels @> {arg(json.dumps(labels))}::jsonb")
+
+    where = f"WHERE {' AND '.join(conditions)}"
+    order_by = "id" if order == "id" else "last_seen DESC, id DESC"
+    rows = await conn.fetch(
+        f"SELECT id, name, labels, last_seen FROM nodes {where} ORDER BY {order_by} LIMIT {arg(limit + 1)}",
+        *args,
+    )
+    return [
+        {
+            "id": r["id"],
+            "name": r["name"],
+            "labels": json.loads(r["labels"]) if r["labels"] else {},
+            "last_seen": r["last_seen"],
+        }
+        for r in rows
+    ]
+
+
+async def get_series(conn, metric: str, node_id, bucket_seconds: int, start, end):
+    # Raw samples and agent summaries folded into the same buckets
+    rows = await conn.fetch(
+        """
+        SELECT bucket, sum(total) / sum(n) AS avg, min(lo) AS min, max(hi) AS max, sum(n) AS count
+        FROM (
+            SELECT time_bucket($1::interval, time) AS bucket,
+                   sum(value) AS total, count(*) AS n, min(value) AS lo, max(value) AS hi
+            FROM metrics
+            WHERE metric_name = $2 AND time >= $3 AND time < $4
+              AND ($5::text IS NULL OR node_id = $5)
+            GROUP BY 1
+            UNION ALL
+            SELECT time_bucket($1::interval, time), sum(sum), sum(count), min(min), max(max)
+            FROM metric_summaries
+            WHERE metric_name = $2 AND time >= $3 AND time < $4
+              AND ($5::text IS NULL OR node_id = $5)
+            GROUP BY 1
+        ) s
+        GROUP BY bucket
+        ORDER BY bucket
+        """,
+        timedelta(seconds=bucket_seconds),
+        metric,
+        start,
+        end,
+        node_id,
+    )
+    return [
+        {"time": r["bucket"], "avg": r["avg"], "min": r["min"], "max": r["max"], "count": r["count"]}
+        for r in rows
+    ]
+
+
+async def init_schema(conn):
+    # db/init only runs against an empty volume; bring upgraded databases in line
+    from jobs import init_jobs_table
+    await init_alerts_table(conn)
+    await init_hypertables(conn)
+    await init_jobs_table(conn)
+    await init_node_indexes(conn)
+
+
+async def init_hypertables(conn):
+    # Tables added after the initial schema (mirrors db/init/01_schema.sql)
+    await conn.execute("""
+        CREATE TABLE IF NOT EXISTS metric_summaries (
+            time TIMESTAMPTZ NOT NULL,
+            window_end TIMESTAMPTZ NOT NULL,
+            node_id TEXT NOT NULL REFERENCES nodes(id) ON DELETE CASCADE,
+            metric_name TEXT NOT NULL,
+            unit TEXT,
+            count INTEGER NOT NULL,
+            min DOUBLE PRECISION NOT NULL,
+            max DOUBLE PRECISION NOT NULL,
+            sum DOUBLE PRECISION NOT NULL,
+            last DOUBLE PRECISION NOT NULL,
+            percentiles JSONB
+        );
+        SELECT create_hypertable('metric_summaries', 'time', if_not_exists => TRUE);
+        CREATE INDEX IF NOT EXISTS idx_metric_summaries_node_time
+        ON metric_summaries (node_id, time DESC);
+
+        CREATE TABLE IF NOT EXISTS containers (
+            id TEXT PRIMARY KEY,
+            node_id TEXT NOT NULL REFERENCES nodes(id) ON DELETE CASCADE,
+            name TEXT NOT NULL,
+            labels JSONB
+        );
+        CREATE INDEX IF NOT EXISTS idx_containers_node
+        ON containers (node_id);
+
+        CREATE TABLE IF NOT EXISTS container_metrics (
+            time TIMESTAMPTZ NOT NULL,
+            container_id TEXT NOT NULL REFERENCES containers(id) ON DELETE CASCADE,
+            metric_name TEXT NOT NULL,
+            value DOUBLE PRECISION NOT NULL,
+            unit TEXT
+        );
+        SELECT create_hypertable('container_metrics', 'time', if_not_exists => TRUE);
+        CREATE INDEX IF NOT EXISTS idx_container_metrics_container_time
+        ON container_metrics (container_id, time DESC);
+    """)
+
+
+async def init_node_indexes(conn):
+    # Keep every /nodes page an index range scan; the partial index needs
+    # nodes.deleted_at, so this runs after init_jobs_table
+    await conn.execute("""
+        UPDATE nodes SET last_seen = 'epoch' WHERE last_seen IS NULL;
+        ALTER TABLE nodes ALTER COLUMN last_seen SET DEFAULT now();
+        ALTER TABLE nodes ALTER COLUMN last_seen SET NOT NULL;
+
+        CREATE INDEX IF NOT EXISTS idx_nodes_last_seen_id
+        ON nodes (last_seen DESC, id DESC) WHERE deleted_at IS NULL;
+        CREATE INDEX IF NOT EXISTS idx_nodes_name_prefix
+        ON nodes (name COLLATE "C");
+        CREATE INDEX IF NOT EXISTS idx_nodes_labels
+        ON nodes USING GIN (labels jsonb_path_ops);
+    """)
+
 
 async def init_alerts_table(conn):
     await conn.execute("""
@@ -0,0 +1,57 @@
+import os
+import shutil
+import asyncio
+
+bind = f"0.0.0.0:{os.getenv('PORT', '3000')}"
+worker_class = "uvicorn.workers.UvicornWorker"
+# No preload: each worker imports the app itself, so the asyncpg pool and
+# other module-level state are created per process, never shared across fork.
+preload_app = False
+
+
+def available_cpus():
+    # cgroup v2 quota ("max 100000" or "200000 100000"), then v1, then affinity
+    try:
+        with open("/sys/fs/cgroup/cpu.max") as f:
+            quota, period = f.read().split()
+        if quota != "max":
+            return max(int(int(quota) / int(period)), 1)
+    except (OSError, ValueError):
+        pass
+    try:
+        with open("/sys/fs/cgroup/cpu/cpu.cfs_quota_us") as f:
+            quota = int(f.read())
+        with open("/sys/fs/cgroup/cpu/cpu.cfs_period_us") as f:
+            period = int(f.read())
+        if quota > 0:
+            return max(quota // period, 1)
+    except (OSError, ValueError):
+        pass
+    return len(os.sched_getaffinity(0))
+
+
+workers = int(os.getenv("WEB_CONCURRENCY") or available_cpus())
+
+
+def on_starting(server):
+    # Runs once in the master before any worker is forked
+    prom_dir = os.getenv("PROMETHEUS_MULTIPROC_DIR")
+    if prom_dir:
+        shutil.rmtree(prom_dir, ignore_errors=True)
+        os.makedirs(prom_dir, exist_ok=True)
+
+    # Split the DB connection budget between workers
+    os.environ.setdefault("DB_POOL_MAX", str(max(int(os.getenv("DB_POOL_TOTAL", "20")) // workers, 2)))
+
+    from db import run_startup_init
+    try:
+        asyncio.run(run_startup_init())
+        os.environ["STARTUP_INIT_DONE"] = "1"
+    except Exception as e:
+        server.log.warning(f"Startup DB init failed: {e}")
+
+
+def child_exit(server, worker):
+    if os.getenv("PROMETHEUS_MULTIPROC_DIR"):
+        from prometheus_client import multiprocess
+        multiprocess.mark_process_dead(worker.pid)
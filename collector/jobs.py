@@ -0,0 +1,246 @@
+import os
+import asyncio
+import socket
+from datetime import timedelta
+
+from db import get_pool
+
+# Purge pacing: each batch is one short transaction, sized to about PURGE_BATCH_ROWS
+PURGE_BATCH_ROWS = int(os.getenv("PURGE_BATCH_ROWS", "20000"))
+PURGE_INITIAL_WINDOW = float(os.getenv("PURGE_INITIAL_WINDOW", "300"))  # seconds of data per first batch
+PURGE_BATCH_PAUSE = float(os.getenv("PURGE_BATCH_PAUSE", "0.1"))
+JOB_POLL_INTERVAL = float(os.getenv("JOB_POLL_INTERVAL", "5"))
+JOB_STALE_AFTER = int(os.getenv("JOB_STALE_AFTER", "60"))  # reclaim silent running jobs, retry failed ones
+
+
+def worker_id():
+    # Not a module constant: the gunicorn master imports this module (via
+    # init_schema) before forking, so an import-time PID would be shared by
+    # every worker in the container
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+
+# (phase, hypertable, predicate selecting the deleted nodes' rows)
+PURGE_PHASES = [
+    ("metrics", "metrics", "node_id = ANY($1)"),
+    ("metric_summaries", "metric_summaries", "node_id = ANY($1)"),
+    ("container_metrics", "container_metrics", "container_id IN (SELECT id FROM containers WHERE node_id = ANY($1))"),
+]
+
+_wakeup = asyncio.Event()
+
+
+class JobLost(Exception):
+    """Another worker took over the job (our heartbeat went stale)."""
+
+
+async def init_jobs_table(conn):
+    await conn.execute("""
+        ALTER TABLE nodes ADD COLUMN IF NOT EXISTS deleted_at TIMESTAMPTZ;
+
+        CREATE TABLE IF NOT EXISTS node_deletion_jobs (
+            id SERIAL PRIMARY KEY,
+            node_ids TEXT[] NOT NULL,
+            all_nodes BOOLEAN NOT NULL DEFAULT FALSE,
+            cutoff TIMESTAMPTZ NOT NULL,
+            status TEXT NOT NULL DEFAULT 'pending',
+            phase TEXT,
+            progress TIMESTAMPTZ,
+            rows_deleted BIGINT NOT NULL DEFAULT 0,
+            error TEXT,
+            worker TEXT,
+            created_at TIMESTAMPTZ NOT NULL DEFAULT now(),
+            started_at TIMESTAMPTZ,
+            heartbeat_at TIMESTAMPTZ,
+            finished_at TIMESTAMPTZ
+        );
+
+        CREATE INDEX IF NOT EXISTS idx_node_deletion_jobs_open
+        ON node_deletion_jobs (id) WHERE status IN ('pending', 'running', 'failed');
+    """)
+
+
+def job_to_dict(row):
+    return {
+        "id": row["id"],
+        "status": row["status"],
+        "nodes": len(row["node_ids"]),
+        "all_nodes": row["all_nodes"],
+        "phase": row["phase"],
+        "progress": row["progress"],
+        "rows_deleted": row["rows_deleted"],
+        "error": row["error"],
+        "created_at": row["created_at"],
+        "started_at": row["started_at"],
+        "finished_at": row["finished_at"],
+    }
+
+
+# ================= ENQUEUE =================
+async def enqueue_deletion(conn, node_id: str = None):
+    """
+    Hides the node (or every node) right away and queues the data purge.
+    Returns the job dict, or None if there was nothing to delete.
+    """
+    async with conn.transaction():
+        if node_id is None:
+            rows = await conn.fetch(
+                "UPDATE nodes SET deleted_at = now() WHERE deleted_at IS NULL RETURNING id"
+            )
+        else:
+            rows = await conn.fetch(
+                "UPDATE nodes SET deleted_at = now() WHERE id = $1 AND deleted_at IS NULL RETURNING id",
+                node_id,
+            )
+        if not rows:
+            return None
+
+        job = await conn.fetchrow(
+            """
+            INSERT INTO node_deletion_jobs (node_ids, all_nodes, cutoff)
+            VALUES ($1, $2, now())
+            RETURNING *
+            """,
+            [r["id"] for r in rows],
+            node_id is None,
+        )
+    _wakeup.set()
+    return job_to_dict(job)
+
+
+async def get_job(conn, job_id: int):
+    row = await conn.fetchrow("SELECT * FROM node_deletion_jobs WHERE id = $1", job_id)
+    return job_to_dict(row) if row else None
+
+
+async def list_jobs(conn, limit: int):
+    rows = await conn.fetch("SELECT * FROM node_deletion_jobs ORDER BY id DESC LIMIT $1", limit)
+    return [job_to_dict(r) for r in rows]
+
+
+# ================= RUNNER =================
+async def claim_job(conn):
+    return await conn.fetchrow(
+        """
+        UPDATE node_deletion_jobs
+        SET status = 'running', worker = $1, heartbeat_at = now(),
+            started_at = coalesce(started_at, now())
+        WHERE id = (
+            SELECT id FROM node_deletion_jobs
+            WHERE status = 'pending'
+               OR (status IN ('running', 'failed') AND heartbeat_at < now() - $2::interval)
+            ORDER BY id
+            LIMIT 1
+            FOR UPDATE SKIP LOCKED
+        )
+        RETURNING *
+        """,
+        worker_id(),
+        timedelta(seconds=JOB_STALE_AFTER),
+    )
+
+
+async def record_progress(conn, job_id, phase, progress, deleted):
+    result = await conn.execute(
+        """
+        UPDATE node_deletion_jobs
+        SET phase = $2, progress = $3, rows_deleted = rows_deleted + $4, heartbeat_at = now()
+        WHERE id = $1 AND worker = $5 AND status = 'running'
+        """,
+        job_id, phase, progress, deleted, worker_id(),
+    )
+    if result.endswith(" 0"):
+        raise JobLost()
+
+
+async def purge_phase(pool, job, phase, table, predicate, resume_from):
+    node_ids, cutoff = job["node_ids"], job["cutoff"]
+
+    if job["all_nodes"] and resume_from is None:
+        # Every chunk that ends before the cutoff only holds deleted nodes' data
+        async with pool.acquire() as conn:
+            await conn.execute(f"SELECT drop_chunks('{table}', older_than => $1::timestamptz)", cutoff)
+
+    window = timedelta(seconds=PURGE_INITIAL_WINDOW)
+    lo = resume_from
+    while True:
+        async with pool.acquire() as conn:
+            # Jump over gaps instead of walking empty windows
+            lo = await conn.fetchval(
+                f"SELECT min(time) FROM {table} WHERE {predicate} AND time >= coalesce($2::timestamptz, '-infinity') AND time < $3",
+                node_ids, lo, cutoff,
+            )
+            if lo is None:
+                return
+            hi = min(lo + window, cutoff)
+            result = await conn.execute(
+                f"DELETE FROM {table} WHERE {predicate} AND time >= $2 AND time < $3",
+                node_ids, lo, hi,
+            )
+            deleted = int(result.split(" ")[1])
+            await record_progress(conn, job["id"], phase, hi, deleted)
+
+        # Size the next window so a batch stays around PURGE_BATCH_ROWS
+        scale = PURGE_BATCH_ROWS / deleted if deleted else 2.0
+        window = min(max(window * min(max(scale, 0.25), 2.0), timedelta(seconds=1)), timedelta(days=7))
+        lo = hi
+        await asyncio.sleep(PURGE_BATCH_PAUSE)
+
+
+async def run_job(pool, job):
+    phases = [p[0] for p in PURGE_PHASES]
+    start = phases.index(job["phase"]) if job["phase"] in phases else 0
+    for phase, table, predicate in PURGE_PHASES[start:]:
+        resume_from = job["progress"] if phase == job["phase"] else None
+        await purge_phase(pool, job, phase, table, predicate, resume_from)
+
+    # What's left (containers, samples stamped after the cutoff) is small enough to cascade
+    async with pool.acquire() as conn:
+        async with conn.transaction():
+            await record_progress(conn, job["id"], "nodes", None, 0)
+            await conn.execute(
+                "DELETE FROM nodes WHERE id = ANY($1) AND deleted_at IS NOT NULL",
+                job["node_ids"],
+            )
+            await conn.execute(
+                "UPDATE node_deletion_jobs SET status = 'done', error = NULL, finished_at = now() WHERE id = $1",
+                job["id"],
+            )
+
+
+async def run_next_job():
+    pool = await get_pool()
+    async with pool.acquire() as conn:
+        job = await claim_job(conn)
+    if job is None:
+        return False
+
+    print(f"Running node deletion job {job['id']} ({len(job['node_ids'])} nodes)")
+    try:
+        await run_job(pool, job)
+        print(f"Node deletion job {job['id']} done")
+    except JobLost:
+        print(f"Node deletion job {job['id']} was taken over by another worker")
+    except Exception as e:
+        print(f"Node deletion job {job['id']} failed: {e}")
+        async with pool.acquire() as conn:
+            await conn.execute(
+                # Retried once JOB_STALE_AFTER has passed
+                "UPDATE node_deletion_jobs SET status = 'failed', error = $2, heartbeat_at = now() WHERE id = $1 AND worker = $3",
+                job["id"], str(e), worker_id(),
+            )
+    return True
+
+
+async def job_runner():
+    while True:
+        try:
+            while await run_next_job():
+                pass
+        except Exception as e:
+            print(f"Node deletion runner error: {e}")
+        try:
+            await asyncio.wait_for(_wakeup.wait(), JOB_POLL_INTERVAL)
+        except asyncio.TimeoutError:
+            pass
+        _wakeup.clear()
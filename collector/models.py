@@ -1,5 +1,5 @@
 from pydantic import BaseModel, Field
-from typing import List
+from typing import Dict, List
 from datetime import datetime
 
 
@@ -13,3 +13,36 @@ class IngestPayload(BaseModel):
     node_id: str = Field(..., min_length=1)
     timestamp: datetime
     metrics: List[Metric]
+    labels: Dict[str, str] | None = None
+
+
+class MetricSummary(BaseModel):
+    name: str
+    unit: str | None = None
+    count: int = Field(..., ge=1)
+    min: float
+    max: float
+    sum: float
+    last: float
+    percentiles: Dict[str, float] | None = None
+
+
+class SummaryPayload(BaseModel):
+    node_id: str = Field(..., min_length=1)
+    window_start: datetime
+    window_end: datetime
+    summaries: List[MetricSummary]
+    labels: Dict[str, str] | None = None
+
+
+class ContainerSample(BaseModel):
+    id: str = Field(..., min_length=1)
+    name: str
+    labels: Dict[str, str] = {}
+    metrics: List[Metric]
+
+
+class ContainerPayload(BaseModel):
+    node_id: str = Field(..., min_length=1)
+    timestamp: datetime
+    containers: List[ContainerSample]
@@ -0,0 +1,147 @@
+import os
+import sys
+import time
+import asyncio
+import threading
+import tracemalloc
+from collections import Counter
+
+MAX_SECONDS = float(os.getenv("PROFILE_MAX_SECONDS", "60"))
+
+# Only one capture per process, i.e. per gunicorn worker; nothing runs
+# (no thread, no tracing) otherwise
+_lock = threading.Lock()
+
+
+class ProfilerBusy(Exception):
+    pass
+
+
+def _frame_label(code):
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+
+
+class _Sampler(threading.Thread):
+    """Walks every thread's stack at a fixed interval via sys._current_frames()."""
+
+    def __init__(self, interval):
+        super().__init__(name="profiler", daemon=True)
+        self.interval = interval
+        self.stacks = Counter()
+        self.samples = 0
+        self._stop_event = threading.Event()
+
+    def run(self):
+        me = threading.get_ident()
+        names = {}
+        while not self._stop_event.wait(self.interval):
+            for ident, frame in sys._current_frames().items():
+                if ident == me:
+                    continue
+                if ident not in names:
+                    names = {t.ident: t.name for t in threading.enumerate()}
+                stack = []
+                while frame is not None:
+                    stack.append(_frame_label(frame.f_code))
+                    frame = frame.f_back
+                stack.append(names.get(ident, str(ident)))
+                self.stacks[tuple(reversed(stack))] += 1
+            self.samples += 1
+
+    def stop(self):
+        self._stop_event.set()
+        self.join()
+
+
+def collapsed(stacks):
+    # Brendan Gregg's folded format, consumable by flamegraph.pl / speedscope
+    return "\n".join(f"{';'.join(stack)} {count}" for stack, count in stacks.most_common())
+
+
+def speedscope(stacks, interval, duration, name):
+    frames, index = [], {}
+    samples, weights = [], []
+    for stack, count in stacks.most_common():
+        ids = []
+        for label in stack:
+            if label not in index:
+                index[label] = len(frames)
+                frames.append({"name": label})
+            ids.append(index[label])
+        samples.append(ids)
+        weights.append(count * interval)
+    return {
+        "$schema": "https://www.speedscope.app/file-format-schema.json",
+        "shared": {"frames": frames},
+        "profiles": [{
+            "type": "sampled",
+            "name": name,
+            "unit": "seconds",
+            "startValue": 0,
+            "endValue": duration,
+            "samples": samples,
+            "weights": weights,
+        }],
+        "name": name,
+        "exporter": "nodesense-profiler",
+    }
+
+
+def top_allocations(snapshot, limit):
+    snapshot = snapshot.filter_traces((
+        tracemalloc.Filter(False, tracemalloc.__file__),
+        tracemalloc.Filter(False, __file__),
+    ))
+    return [
+        {
+            "file": stat.traceback[0].filename,
+            "line": stat.traceback[0].lineno,
+            "size_bytes": stat.size,
+            "count": stat.count,
+        }
+        for stat in snapshot.statistics("lineno")[:limit]
+    ]
+
+
+async def capture(seconds, fmt="speedscope", interval=0.005, top=20, name="profile"):
+    seconds = min(max(seconds, 0.1), MAX_SECONDS)
+    if not _lock.acquire(blocking=False):
+        raise ProfilerBusy()
+
+    loop = asyncio.get_running_loop()
+    was_tracing = tracemalloc.is_tracing()
+    try:
+        if not was_tracing:
+            tracemalloc.start()
+        sampler = _Sampler(interval)
+        start = time.perf_counter()
+        sampler.start()
+        try:
+            await asyncio.sleep(seconds)
+        finally:
+            sampler.stop()
+            duration = time.perf_counter() - start
+            # Snapshotting a busy heap takes a while; keep it off the event loop
+            snapshot = await loop.run_in_executor(None, tracemalloc.take_snapshot)
+    finally:
+        if not was_tracing:
+            tracemalloc.stop()
+        _lock.release()
+
+    if fmt == "collapsed":
+        cpu = collapsed(sampler.stacks)
+    else:
+        cpu = speedscope(sampler.stacks, interval, duration, name)
+
+    allocations = await loop.run_in_executor(None, top_allocations, snapshot, top)
+
+    return {
+        "name": name,
+        "pid": os.getpid(),
+        "duration_s": round(duration, 3),
+        "interval_s": interval,
+        "samples": sampler.samples,
+        "format": fmt,
+        "cpu": cpu,
+        "allocations": allocations,
+    }
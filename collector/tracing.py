@@ -0,0 +1,59 @@
+import os
+import time
+import random
+import logging
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from prometheus_client import Histogram
+
+# Fraction of hot-path log lines that are actually emitted
+LOG_SAMPLE_RATE = float(os.getenv("LOG_SAMPLE_RATE", "0.01"))
+
+logger = logging.getLogger("collector")
+
+STAGE_SECONDS = Histogram(
+    "collector_stage_seconds",
+    "Time spent per ingest stage in the collector",
+    ["stage"],
+    buckets=(0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 1.0),
+)
+
+INGEST_LAG_SECONDS = Histogram(
+    "collector_ingest_lag_seconds",
+    "Time between a sample's timestamp and its arrival at the collector",
+    ["kind"],
+    buckets=(0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0),
+)
+
+# Resolve label children once instead of on every observation
+_stages = {}
+
+
+@contextmanager
+def stage(name):
+    child = _stages.get(name)
+    if child is None:
+        child = _stages[name] = STAGE_SECONDS.labels(stage=name)
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        child.observe(time.perf_counter() - start)
+
+
+def observe_lag(kind, timestamp):
+    if timestamp.tzinfo is None:
+        timestamp = timestamp.replace(tzinfo=timezone.utc)
+    lag = (datetime.now(timezone.utc) - timestamp).total_seconds()
+    # Clock skew can make the agent appear to be in the future
+    INGEST_LAG_SECONDS.labels(kind=kind).observe(max(lag, 0.0))
+
+
+def trace_id(request):
+    parts = request.headers.get("traceparent", "").split("-")
+    return parts[1] if len(parts) == 4 else "-"
+
+
+def log_sampled(msg, *args, level=logging.INFO):
+    if random.random() < LOG_SAMPLE_RATE:
+        logger.log(level, msg, *args)
@@ -6,9 +6,20 @@ CREATE TABLE IF NOT EXISTS nodes (
   id TEXT PRIMARY KEY,
   name TEXT NOT NULL,
   labels JSONB,
-  last_seen TIMESTAMPTZ DEFAULT now()
+  last_seen TIMESTAMPTZ NOT NULL DEFAULT now(),
+  deleted_at TIMESTAMPTZ -- set while a deletion job purges the node's data
 );
 
+-- Indexes for keyset pagination and filtering of the node listing
+CREATE INDEX IF NOT EXISTS idx_nodes_last_seen_id
+ON nodes (last_seen DESC, id DESC) WHERE deleted_at IS NULL;
+
+CREATE INDEX IF NOT EXISTS idx_nodes_name_prefix
+ON nodes (name COLLATE "C");
+
+CREATE INDEX IF NOT EXISTS idx_nodes_labels
+ON nodes USING GIN (labels jsonb_path_ops);
+
 -- Table: metrics (time-series)
 CREATE TABLE IF NOT EXISTS metrics (
   time TIMESTAMPTZ NOT NULL,
@@ -25,3 +36,49 @@ SELECT create_hypertable('metrics', 'time', if_not_exists => TRUE);
 CREATE INDEX IF NOT EXISTS idx_metrics_node_time
 ON metrics (node_id, time DESC);
 
+
+
+-- Table: metric_summaries (agent pre-aggregated windows)
+CREATE TABLE IF NOT EXISTS metric_summaries (
+  time TIMESTAMPTZ NOT NULL,
+  window_end TIMESTAMPTZ NOT NULL,
+  node_id TEXT NOT NULL REFERENCES nodes(id) ON DELETE CASCADE,
+  metric_name TEXT NOT NULL,
+  unit TEXT,
+  count INTEGER NOT NULL,
+  min DOUBLE PRECISION NOT NULL,
+  max DOUBLE PRECISION NOT NULL,
+  sum DOUBLE PRECISION NOT NULL,
+  last DOUBLE PRECISION NOT NULL,
+  percentiles JSONB
+);
+
+SELECT create_hypertable('metric_summaries', 'time', if_not_exists => TRUE);
+
+CREATE INDEX IF NOT EXISTS idx_metric_summaries_node_time
+ON metric_summaries (node_id, time DESC);
+
+-- Table: containers (per-node container registry)
+CREATE TABLE IF NOT EXISTS containers (
+  id TEXT PRIMARY KEY,
+  node_id TEXT NOT NULL REFERENCES nodes(id) ON DELETE CASCADE,
+  name TEXT NOT NULL,
+  labels JSONB
+);
+
+CREATE INDEX IF NOT EXISTS idx_containers_node
+ON containers (node_id);
+
+-- Table: container_metrics (time-series, one row per container metric)
+CREATE TABLE IF NOT EXISTS container_metrics (
+  time TIMESTAMPTZ NOT NULL,
+  container_id TEXT NOT NULL REFERENCES containers(id) ON DELETE CASCADE,
+  metric_name TEXT NOT NULL,
+  value DOUBLE PRECISION NOT NULL,
+  unit TEXT
+);
+
+SELECT create_hypertable('container_metrics', 'time', if_not_exists => TRUE);
+
+CREATE INDEX IF NOT EXISTS idx_container_metrics_container_time
+ON container_metrics (container_id, time DESC);
\ No newline at end of file
@@ -3,7 +3,7 @@ import { AlertCircle, X } from 'lucide-react';
 
 interface Alert {
     id: number;
-    node_id: string;
+    node_id: string | null;
     message: string;
     timestamp: string;
     read: boolean;
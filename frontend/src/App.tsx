@@ -4,6 +4,8 @@ import { Activity, Server, Plus, ShieldCheck, RefreshCw, Smartphone, Trash2, Net
 import AlertPopup from './AlertPopup';
 
 const GATEWAY_URL = ''; // Relative path, handled by Vite Proxy
+const NODES_PAGE_SIZE = 60;
+const NODES_PAGE_MAX = 1000;
 
 interface NodeData {
     id: string;
@@ -21,6 +23,9 @@ interface ServiceData {
 function App() {
     const [view, setView] = useState<'dashboard' | 'system'>('dashboard');
     const [nodes, setNodes] = useState<NodeData[]>([]);
+    const [nodeLimit, setNodeLimit] = useState(NODES_PAGE_SIZE);
+    const [hasMoreNodes, setHasMoreNodes] = useState(false);
+    const [statusFilter, setStatusFilter] = useState('');
     const [token, setToken] = useState<string | null>(null);
     const [isAdmin, setIsAdmin] = useState(false);
 
@@ -30,13 +35,18 @@ function App() {
     const [logs, setLogs] = useState<string[]>([]);
     const [loadingLogs, setLoadingLogs] = useState(false);
 
-    // Fetch Nodes
+    // Fetch Nodes (only as many as are on screen; the server paginates)
     const fetchNodes = async () => {
         try {
-            const res = await fetch(`${GATEWAY_URL}/api/nodes`);
+            const params = new URLSearchParams({ limit: String(nodeLimit), fields: 'id,name,last_seen' });
+            if (statusFilter) params.set('status', statusFilter);
+            const res = await fetch(`${GATEWAY_URL}/api/nodes?${params}`);
             if (!res.ok) return;
             const data = await res.json();
-            if (Array.isArray(data)) setNodes(data);
+            if (Array.isArray(data.items)) {
+                setNodes(data.items);
+                setHasMoreNodes(data.next_cursor !== null);
+            }
         } catch (err) { console.error(err); }
     };
 
@@ -79,7 +89,7 @@ function App() {
         fetchNodes();
         const interval = setInterval(fetchNodes, 5000);
         return () => clearInterval(interval);
-    }, []);
+    }, [nodeLimit, statusFilter]);
 
     useEffect(() => {
         if (view === 'system' && isAdmin) {
@@ -121,8 +131,8 @@ function App() {
                 { name: 'mem_total', value: memTotal, unit: 'bytes' },
                 { name: 'disk_percent', value: Math.random() * 90, unit: '%' },
                 { name: 'process_count', value: Math.floor(Math.random() * 200) + 50, unit: 'count' },
-                { name: 'net_bytes_recv', value: Math.random() * 1000000, unit: 'bytes' },
-                { name: 'net_bytes_sent', value: Math.random() * 500000, unit: 'bytes' }
+                { name: 'net_bytes_recv_rate', value: Math.random() * 1000000, unit: 'bytes/s' },
+                { name: 'net_bytes_sent_rate', value: Math.random() * 500000, unit: 'bytes/s' }
             ]
         };
 
@@ -284,7 +294,7 @@ function App() {
                                 <h2 className="text-xl font-semibold mb-4">System Status</h2>
                                 <div className="space-y-2 text-sm">
                                     <div className="flex justify-between"><span>Gateway:</span> <span className="text-green-400">Online</span></div>
-                                    <div className="flex justify-between"><span>Active Nodes:</span> <span className="font-mono text-cyan-300">{nodes.length}</span></div>
+                                    <div className="flex justify-between"><span>Active Nodes:</span> <span className="font-mono text-cyan-300">{nodes.length}{hasMoreNodes ? '+' : ''}</span></div>
                                     {/* We could fetch replicas count here too if we had endpoint */}
                                 </div>
                             </div>
@@ -295,6 +305,16 @@ function App() {
                             <div className="flex justify-between items-center mb-6">
                                 <h2 className="text-2xl font-semibold">Active Nodes Topology</h2>
                                 <div className="flex gap-2">
+                                    <select
+                                        value={statusFilter}
+                                        onChange={(e) => { setStatusFilter(e.target.value); setNodeLimit(NODES_PAGE_SIZE); }}
+                                        className="px-2 py-2 bg-slate-800 rounded text-sm"
+                                    >
+                                        <option value="">All</option>
+                                        <option value="up">Up</option>
+                                        <option value="stale">Stale</option>
+                                        <option value="down">Down</option>
+                                    </select>
                                     {isAdmin && nodes.length > 0 && (
                                         <button onClick={deleteAllNodes} className="px-3 py-2 bg-red-900/50 hover:bg-red-900 text-red-200 rounded text-sm flex items-center gap-2">
                                             <Trash2 size={16} /> Clear All
@@ -337,6 +357,16 @@ function App() {
                                     ))}
                                 </div>
                             )}
+                            {hasMoreNodes && nodeLimit < NODES_PAGE_MAX && (
+                                <div className="text-center mt-6">
+                                    <button
+                                        onClick={() => setNodeLimit(Math.min(nodeLimit + NODES_PAGE_SIZE, NODES_PAGE_MAX))}
+                                        className="px-4 py-2 bg-slate-800 rounded hover:bg-slate-700 text-sm"
+                                    >
+                                        Load more
+                                    </button>
+                                </div>
+                            )}
                         </div>
                     </div>
                 )}
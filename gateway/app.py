@@ -1,13 +1,21 @@
 import os
 import time
+import posixpath
+import asyncio
+import logging
 import httpx
 import redis.asyncio as redis
 import docker
 from fastapi import FastAPI, Request, Response, HTTPException, Security
 from fastapi.middleware.cors import CORSMiddleware
-from auth import verify_token, verify_admin
+from auth import verify_token, verify_admin, JWKS_URL
+from tracing import stage, trace_headers, logger, log_sampled
+from middleware import FastPathMiddleware, ServerHeaderMiddleware, RateLimitMiddleware
+import health
+import profiler
+from prometheus_client import make_asgi_app, generate_latest, CollectorRegistry, CONTENT_TYPE_LATEST, REGISTRY, multiprocess
 from pydantic import BaseModel, Field
-from typing import List
+from typing import Dict, List
 from datetime import datetime
 
 class Metric(BaseModel):
@@ -19,9 +27,55 @@ class IngestPayload(BaseModel):
     node_id: str = Field(..., min_length=1)
     timestamp: datetime
     metrics: List[Metric]
+    labels: Dict[str, str] | None = None
+
+class MetricSummary(BaseModel):
+    name: str
+    unit: str | None = None
+    count: int = Field(..., ge=1)
+    min: float
+    max: float
+    sum: float
+    last: float
+    percentiles: Dict[str, float] | None = None
+
+class SummaryPayload(BaseModel):
+    node_id: str = Field(..., min_length=1)
+    window_start: datetime
+    window_end: datetime
+    summaries: List[MetricSummary]
+    labels: Dict[str, str] | None = None
+
+class ContainerSample(BaseModel):
+    id: str = Field(..., min_length=1)
+    name: str
+    labels: Dict[str, str] = {}
+    metrics: List[Metric]
+
+class ContainerPayload(BaseModel):
+    node_id: str = Field(..., min_length=1)
+    timestamp: datetime
+    containers: List[ContainerSample]
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 
 app = FastAPI(title="NodeSense Gateway")
 
+# Prometheus Metrics (stage histograms, aggregated across workers under gunicorn)
+if os.getenv("PROMETHEUS_MULTIPROC_DIR"):
+    _registry = CollectorRegistry()
+    multiprocess.MultiProcessCollector(_registry)
+else:
+    _registry = REGISTRY
+
+# The mount only matches "/metrics/..."; a bare "/metrics" would otherwise
+# fall through to the authenticated catch-all proxy route
+@app.get("/metrics", include_in_schema=False)
+async def metrics():
+    return Response(content=generate_latest(_registry), media_type=CONTENT_TYPE_LATEST)
+
+app.mount("/metrics", make_asgi_app(registry=_registry))
+
 app.add_middleware(
     CORSMiddleware,
     allow_origins=["*"],
@@ -35,49 +89,61 @@ REDIS_URL = os.getenv("REDIS_URL", "redis://redis:6379")
 COLLECTOR_URL = os.getenv("COLLECTOR_URL", "http://collector:3000")
 RATE_LIMIT_WINDOW = 60  # seconds
 RATE_LIMIT_MAX_REQUESTS = int(os.getenv("RATE_LIMIT", "1000"))  # requests per window
+# Probes and metrics scrapes are never rate limited
+RATE_LIMIT_EXEMPT = ("/health", "/ping", "/livez", "/readyz")
+REDIS_TIMEOUT = float(os.getenv("REDIS_TIMEOUT", "0.5"))
+# Collector paths (and methods) the generic proxy only forwards for admins
+ADMIN_PROXY_PREFIXES = ("/debug", "/jobs")
+ADMIN_PROXY_METHODS = ("DELETE",)
 
 # Redis Connection
-r = redis.from_url(REDIS_URL, encoding="utf-8", decode_responses=True)
+r = redis.from_url(
+    REDIS_URL, encoding="utf-8", decode_responses=True,
+    socket_timeout=REDIS_TIMEOUT, socket_connect_timeout=REDIS_TIMEOUT,
+)
 
 # Docker Client
 try:
     docker_client = docker.from_env()
 except Exception as e:
-    print(f"Warning: Docker client failed to initialize: {e}")
+    logger.warning(f"Docker client failed to initialize: {e}")
     docker_client = None
 
 async def check_rate_limit(client_id: str):
     key = f"rate_limit:{client_id}"
-    current = await r.incr(key)
-    if current == 1:
-        await r.expire(key, RATE_LIMIT_WINDOW)
+    with stage("rate_limit"):
+        try:
+            current = await r.incr(key)
+            if current == 1:
+                await r.expire(key, RATE_LIMIT_WINDOW)
+        except (redis.RedisError, OSError, asyncio.TimeoutError) as e:
+            # Fail open: a slow or unreachable Redis must not take the API down
+            log_sampled("Rate limit check skipped: %s", e, level=logging.WARNING)
+            return True
     if current > RATE_LIMIT_MAX_REQUESTS:
         return False
     return True
 
-print("DEBUG: App Module Loaded")
+logger.info("Gateway module loaded")
 
-@app.middleware("http")
-async def add_server_header(request: Request, call_next):
-    response = await call_next(request)
-    response.headers["X-Served-By"] = os.getenv("HOSTNAME", "unknown")
-    return response
-
-@app.middleware("http")
-async def rate_limit_middleware(request: Request, call_next):
-    client_ip = request.client.host
-    if "x-forwarded-for" in request.headers:
-        client_ip = request.headers["x-forwarded-for"]
-    
-    if not await check_rate_limit(client_ip):
-        return Response(content='{"detail": "Rate limit exceeded"}', status_code=429, media_type="application/json")
-    
-    response = await call_next(request)
-    return response
-
-@app.get("/health")
-async def health_check():
-    return {"status": "ok", "service": "gateway", "host": os.getenv("HOSTNAME", "unknown")}
+# Outermost last: probes are answered first, then every other response gets
+# X-Served-By (including 429s) before rate limiting runs
+app.add_middleware(
+    RateLimitMiddleware,
+    check=check_rate_limit,
+    exempt=RATE_LIMIT_EXEMPT,
+    exempt_prefixes=("/metrics",),
+)
+app.add_middleware(ServerHeaderMiddleware)
+app.add_middleware(
+    FastPathMiddleware,
+    routes={
+        "/health": health.liveness,
+        "/livez": health.liveness,
+        "/ping": health.ping,
+        "/readyz": health.readiness,
+    },
+)
 
 @app.post("/api/debug/db-error")
 async def debug_db_error_proxy(user=Security(verify_token)):
@@ -88,12 +154,34 @@ async def debug_db_error_proxy(user=Security(verify_token)):
     except httpx.ConnectError:
          raise HTTPException(status_code=503, detail="Collector service unavailable")
 
-@app.get("/ping")
-async def ping():
-    return "pong"
+# Reverse Proxy Client (one per worker, created inside the worker's event loop)
+client = None
+_probe_task = None
+
+async def probe_collector():
+    resp = await client.get("/health", timeout=health.PROBE_TIMEOUT)
+    resp.raise_for_status()
+
+async def probe_keycloak():
+    resp = await client.get(JWKS_URL, timeout=health.PROBE_TIMEOUT)
+    resp.raise_for_status()
+
+@app.on_event("startup")
+async def create_client():
+    global client, _probe_task
+    client = httpx.AsyncClient(base_url=COLLECTOR_URL)
+    _probe_task = asyncio.create_task(health.probe_loop({
+        "redis": r.ping,
+        "collector": probe_collector,
+        "keycloak": probe_keycloak,
+    }))
 
-# Reverse Proxy Client
-client = httpx.AsyncClient(base_url=COLLECTOR_URL)
+@app.on_event("shutdown")
+async def close_client():
+    if _probe_task is not None:
+        _probe_task.cancel()
+    if client is not None:
+        await client.aclose()
 
 class LoginRequest(BaseModel):
     username: str
@@ -121,13 +209,21 @@ async def login_proxy(creds: LoginRequest):
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.get("/api/nodes")
-async def get_nodes_proxy():
+async def get_nodes_proxy(request: Request):
     try:
-        rp_resp = await client.get("/nodes")
+        rp_resp = await client.get("/nodes", params=request.query_params)
         return Response(content=rp_resp.content, status_code=rp_resp.status_code, headers=rp_resp.headers)
     except httpx.ConnectError:
          raise HTTPException(status_code=503, detail="Collector service unavailable")
 
+@app.get("/api/series")
+async def get_series_proxy(request: Request):
+    try:
+        rp_resp = await client.get("/series", params=request.query_params)
+        return Response(content=rp_resp.content, status_code=rp_resp.status_code, media_type="application/json")
+    except httpx.ConnectError:
+         raise HTTPException(status_code=503, detail="Collector service unavailable")
+
 @app.delete("/api/nodes/{node_id}")
 async def delete_node_proxy(node_id: str, user=Security(verify_admin)):
     try:
@@ -144,6 +240,22 @@ async def delete_all_nodes_proxy(user=Security(verify_admin)):
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+@app.get("/api/jobs")
+async def list_jobs_proxy(request: Request, user=Security(verify_admin)):
+    try:
+        rp_resp = await client.get("/jobs", params=request.query_params)
+        return Response(content=rp_resp.content, status_code=rp_resp.status_code, media_type="application/json")
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.get("/api/jobs/{job_id}")
+async def get_job_proxy(job_id: int, user=Security(verify_admin)):
+    try:
+        rp_resp = await client.get(f"/jobs/{job_id}")
+        return Response(content=rp_resp.content, status_code=rp_resp.status_code, media_type="application/json")
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
 @app.get("/api/system/topology")
 async def get_system_topology(user=Security(verify_admin)):
     if not docker_client:
@@ -186,7 +298,7 @@ async def get_service_logs(service_name: str, user=Security(verify_admin)):
         
         # Use low-level API to avoid blocking generators
         service = services[0]
-        print(f"DEBUG: Low-level logs fetch for {service.name}", flush=True)
+        logger.debug(f"Low-level logs fetch for {service.name}")
         
         # Returns bytes if stream=False, generator if stream=True
         # We explicitly want headers/timestamps/stdout/stderr, strict blocking=False
@@ -202,11 +314,11 @@ async def get_service_logs(service_name: str, user=Security(verify_admin)):
         decoded_logs = []
         
         if hasattr(logs, '__iter__') and not isinstance(logs, (bytes, str)):
-             print("DEBUG: Low-level returned generator, draining...", flush=True)
+             logger.debug("Low-level returned generator, draining...")
              for line in logs:
                  decoded_logs.append(line.decode('utf-8', errors='replace').strip())
         else:
-             print(f"DEBUG: Low-level returned bytes (len={len(logs)})", flush=True)
+             logger.debug(f"Low-level returned bytes (len={len(logs)})")
              decoded = logs.decode("utf-8", errors='replace')
              decoded_logs = decoded.split("\n")
         
@@ -215,6 +327,31 @@ async def get_service_logs(service_name: str, user=Security(verify_admin)):
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+@app.get("/api/system/profile")
+async def profile_replica(seconds: float = 10, format: str = "speedscope", target: str = "gateway",
+                          top: int = 20, user=Security(verify_admin)):
+    if format not in ("speedscope", "collapsed"):
+        raise HTTPException(status_code=400, detail="format must be 'speedscope' or 'collapsed'")
+
+    if target == "collector":
+        # Profile whichever collector replica the service VIP routes us to
+        try:
+            rp_resp = await client.get(
+                "/debug/profile",
+                params={"seconds": seconds, "format": format, "top": top},
+                timeout=min(seconds, profiler.MAX_SECONDS) + 10,
+            )
+            return Response(content=rp_resp.content, status_code=rp_resp.status_code, media_type="application/json")
+        except httpx.ConnectError:
+            raise HTTPException(status_code=503, detail="Collector service unavailable")
+    if target != "gateway":
+        raise HTTPException(status_code=400, detail="target must be 'gateway' or 'collector'")
+
+    try:
+        return await profiler.capture(seconds, fmt=format, top=top, name=f"gateway@{os.getenv('HOSTNAME', 'unknown')}:{os.getpid()}")
+    except profiler.ProfilerBusy:
+        raise HTTPException(status_code=409, detail="A profile is already being captured in this worker")
+
 @app.get("/api/system/alerts")
 async def get_alerts(user=Security(verify_token)):
     # Read alerts from DB
@@ -240,14 +377,35 @@ async def get_alerts(user=Security(verify_token)):
             })
         return alerts
     except Exception as e:
-        print(f"Alert fetch error: {e}")
+        logger.warning(f"Alert fetch error: {e}")
         return [] # Return empty on error to not break UI
 
 @app.post("/ingest")
-async def ingest(payload: IngestPayload, user=Security(verify_token)):
+async def ingest(payload: IngestPayload, request: Request, user=Security(verify_token)):
     # Proxy ingest to collector
     try:
-        rp_resp = await client.post("/ingest", json=payload.model_dump(mode='json'))
+        with stage("proxy"):
+            rp_resp = await client.post("/ingest", json=payload.model_dump(mode='json'), headers=trace_headers(request))
+        return Response(content=rp_resp.content, status_code=rp_resp.status_code)
+    except httpx.ConnectError:
+         raise HTTPException(status_code=503, detail="Collector service unavailable")
+
+@app.post("/ingest/summary")
+async def ingest_summary(payload: SummaryPayload, request: Request, user=Security(verify_token)):
+    # Proxy pre-aggregated agent windows to collector
+    try:
+        with stage("proxy"):
+            rp_resp = await client.post("/ingest/summary", json=payload.model_dump(mode='json'), headers=trace_headers(request))
+        return Response(content=rp_resp.content, status_code=rp_resp.status_code)
+    except httpx.ConnectError:
+         raise HTTPException(status_code=503, detail="Collector service unavailable")
+
+@app.post("/ingest/containers")
+async def ingest_containers(payload: ContainerPayload, request: Request, user=Security(verify_token)):
+    # Proxy batched per-container samples to collector
+    try:
+        with stage("proxy"):
+            rp_resp = await client.post("/ingest/containers", json=payload.model_dump(mode='json'), headers=trace_headers(request))
         return Response(content=rp_resp.content, status_code=rp_resp.status_code)
     except httpx.ConnectError:
          raise HTTPException(status_code=503, detail="Collector service unavailable")
@@ -255,8 +413,12 @@ async def ingest(payload: IngestPayload, user=Security(verify_token)):
 @app.api_route("/{path_name:path}", methods=["GET", "POST", "PUT", "DELETE"])
 async def proxy_to_collector(request: Request, path_name: str, user=Security(verify_token)):
     # Fallback generic proxy
-    if not path_name.startswith("/"):
-        path_name = "/" + path_name
+    # Normalized so "//debug" or "/x/../debug" can't slip past the prefix check
+    path_name = posixpath.normpath("/" + path_name.lstrip("/"))
+    if request.method in ADMIN_PROXY_METHODS or any(
+        path_name == p or path_name.startswith(p + "/") for p in ADMIN_PROXY_PREFIXES
+    ):
+        await verify_admin(user)
     
     url = path_name
     if request.url.query:
@@ -270,7 +432,8 @@ async def proxy_to_collector(request: Request, path_name: str, user=Security(ver
     )
     
     try:
-        rp_resp = await client.send(rp_req)
+        with stage("proxy"):
+            rp_resp = await client.send(rp_req)
         return Response(content=rp_resp.content, status_code=rp_resp.status_code, headers=rp_resp.headers)
     except httpx.ConnectError:
          raise HTTPException(status_code=503, detail="Collector service unavailable")
@@ -3,6 +3,7 @@ import httpx
 from fastapi import Request, HTTPException, Security
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 from jose import jwt, JWTError
+from tracing import stage, log_sampled, logger
 
 # Configuration
 KEYCLOAK_URL = os.getenv("KEYCLOAK_URL", "http://keycloak:8080")
@@ -15,19 +16,22 @@ JWKS_URL = f"{KEYCLOAK_URL}/realms/{REALM}/protocol/openid-connect/certs"
 security = HTTPBearer()
 
 async def get_public_key():
-    print(f"DEBUG: Fetching JWKS from {JWKS_URL}")
     async with httpx.AsyncClient() as client:
         try:
-            resp = await client.get(JWKS_URL)
-            print(f"DEBUG: JWKS Response Status: {resp.status_code}")
+            with stage("jwks_fetch"):
+                resp = await client.get(JWKS_URL)
+            log_sampled("JWKS fetched from %s (status %s)", JWKS_URL, resp.status_code)
             resp.raise_for_status()
             return resp.json()
         except Exception as e:
-            print(f"DEBUG: Failed to fetch JWKS: {e}")
+            logger.warning("Failed to fetch JWKS from %s: %s", JWKS_URL, e)
             raise HTTPException(status_code=500, detail="Auth service unavailable")
 
 async def verify_token(credentials: HTTPAuthorizationCredentials = Security(security)):
-    print("DEBUG: verify_token called")
+    with stage("auth"):
+        return await _verify_token(credentials)
+
+async def _verify_token(credentials: HTTPAuthorizationCredentials):
     token = credentials.credentials
     
     try:
@@ -37,9 +41,7 @@ async def verify_token(credentials: HTTPAuthorizationCredentials = Security(secu
         # We will attempt verification.
         
         jwks = await get_public_key()
-        print("DEBUG: JWKS fetched")
 
-        
         # Verify token
         payload = jwt.decode(
             token,
@@ -51,12 +53,12 @@ async def verify_token(credentials: HTTPAuthorizationCredentials = Security(secu
         return payload
     except JWTError as e:
         raise HTTPException(status_code=401, detail=f"Invalid token: {str(e)}")
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 async def verify_admin(payload: dict = Security(verify_token)):
-    print(f"DEBUG: Verifying admin role for user: {payload.get('preferred_username', 'unknown')}")
-    
     # Check Realm Roles
     realm_access = payload.get("realm_access", {})
     roles = realm_access.get("roles", [])
@@ -64,5 +66,5 @@ async def verify_admin(payload: dict = Security(verify_token)):
     if "admin" in roles:
         return payload
         
-    print(f"DEBUG: Access denied. User roles: {roles}")
+    log_sampled("Access denied for %s, roles: %s", payload.get("preferred_username", "unknown"), roles)
     raise HTTPException(status_code=403, detail="Admin privileges required")
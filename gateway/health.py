@@ -0,0 +1,72 @@
+import os
+import time
+import json
+import asyncio
+
+from tracing import logger
+
+# Dependencies are probed in the background; probe endpoints only read the results
+PROBE_INTERVAL = float(os.getenv("PROBE_INTERVAL", "5"))
+PROBE_TIMEOUT = float(os.getenv("PROBE_TIMEOUT", "2"))
+# Dependencies that must be healthy for /readyz to pass; the rest are reported only
+READY_REQUIRES = [d.strip() for d in os.getenv("READY_REQUIRES", "collector").split(",") if d.strip()]
+
+HOST = os.getenv("HOSTNAME", "unknown")
+
+# Liveness never touches a dependency, so its body can be encoded once
+LIVE_BODY = json.dumps({"status": "ok", "service": "gateway", "host": HOST}).encode()
+PONG_BODY = b'"pong"'
+
+_results = {}
+
+
+async def _probe(name, check):
+    start = time.perf_counter()
+    try:
+        await asyncio.wait_for(check(), PROBE_TIMEOUT)
+        ok, error = True, None
+    except Exception as e:
+        ok, error = False, str(e) or type(e).__name__
+
+    previous = _results.get(name)
+    if previous is not None and previous["ok"] != ok:
+        logger.warning(f"Dependency {name} is now {'up' if ok else 'down'}{': ' + error if error else ''}")
+    _results[name] = {
+        "ok": ok,
+        "latency_ms": round((time.perf_counter() - start) * 1000, 1),
+        "checked_at": time.time(),
+        "error": error,
+    }
+
+
+async def probe_loop(checks):
+    """checks: dependency name -> zero-argument coroutine function that raises when unhealthy."""
+    while True:
+        await asyncio.gather(*(_probe(name, check) for name, check in checks.items()))
+        await asyncio.sleep(PROBE_INTERVAL)
+
+
+def liveness():
+    return 200, LIVE_BODY
+
+
+def ping():
+    return 200, PONG_BODY
+
+
+def readiness():
+    now = time.time()
+    dependencies = {}
+    for name, result in _results.items():
+        # A probe loop that stopped reporting counts as failing
+        stale = now - result["checked_at"] > 3 * PROBE_INTERVAL + PROBE_TIMEOUT
+        dependencies[name] = dict(result, ok=result["ok"] and not stale, stale=stale)
+
+    ready = all(dependencies.get(name, {}).get("ok") for name in READY_REQUIRES)
+    body = json.dumps({
+        "status": "ready" if ready else "not ready",
+        "host": HOST,
+        "requires": READY_REQUIRES,
+        "dependencies": dependencies,
+    }).encode()
+    return (200 if ready else 503), body
@@ -0,0 +1,93 @@
+import os
+
+# Pure ASGI middleware: no per-request Request/Response objects or extra
+# task like BaseHTTPMiddleware (@app.middleware("http")) creates.
+
+SERVED_BY = os.getenv("HOSTNAME", "unknown").encode()
+RATE_LIMITED_BODY = b'{"detail": "Rate limit exceeded"}'
+
+
+async def send_response(send, status, body, extra_headers=(), head=False):
+    await send({
+        "type": "http.response.start",
+        "status": status,
+        "headers": [
+            (b"content-type", b"application/json"),
+            (b"content-length", str(len(body)).encode()),
+            *extra_headers,
+        ],
+    })
+    await send({"type": "http.response.body", "body": b"" if head else body})
+
+
+class FastPathMiddleware:
+    """
+    Answers probe endpoints before anything else runs: no rate limiting,
+    auth, routing or validation. `routes` maps a path to a zero-argument
+    function returning (status, body).
+    """
+
+    def __init__(self, app, routes):
+        self.app = app
+        self.routes = routes
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "http" and scope["method"] in ("GET", "HEAD"):
+            handler = self.routes.get(scope["path"])
+            if handler is not None:
+                status, body = handler()
+                # Sits outside ServerHeaderMiddleware, so sets X-Served-By itself
+                await send_response(
+                    send, status, body, extra_headers=[(b"x-served-by", SERVED_BY)], head=scope["method"] == "HEAD"
+                )
+                return
+        await self.app(scope, receive, send)
+
+
+class ServerHeaderMiddleware:
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        async def send_with_header(message):
+            if message["type"] == "http.response.start":
+                message["headers"] = list(message.get("headers", [])) + [(b"x-served-by", SERVED_BY)]
+            await send(message)
+
+        await self.app(scope, receive, send_with_header)
+
+
+class RateLimitMiddleware:
+    """
+    Per-client rate limiting via `check(client_id) -> bool`. Paths in
+    `exempt` (exact) or under `exempt_prefixes` skip the check entirely.
+    """
+
+    def __init__(self, app, check, exempt=(), exempt_prefixes=()):
+        self.app = app
+        self.check = check
+        self.exempt = frozenset(exempt)
+        self.exempt_prefixes = tuple(exempt_prefixes)
+
+    async def __call__(self, scope, receive, send):
+        path = scope.get("path", "")
+        if scope["type"] != "http" or path in self.exempt or path.startswith(self.exempt_prefixes):
+            await self.app(scope, receive, send)
+            return
+
+        client_id = None
+        for name, value in scope["headers"]:
+            if name == b"x-forwarded-for":
+                client_id = value.decode("latin-1")
+                break
+        if client_id is None:
+            client_id = scope["client"][0] if scope.get("client") else "unknown"
+
+        if not await self.check(client_id):
+            await send_response(send, 429, RATE_LIMITED_BODY)
+            return
+        await self.app(scope, receive, send)
@@ -0,0 +1,55 @@
+import os
+import time
+import random
+import logging
+from contextlib import contextmanager
+from prometheus_client import Histogram
+
+# Fraction of hot-path log lines that are actually emitted
+LOG_SAMPLE_RATE = float(os.getenv("LOG_SAMPLE_RATE", "0.01"))
+
+logger = logging.getLogger("gateway")
+
+STAGE_SECONDS = Histogram(
+    "gateway_stage_seconds",
+    "Time spent per request stage in the gateway",
+    ["stage"],
+    buckets=(0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5),
+)
+
+# Resolve label children once instead of on every observation
+_stages = {}
+
+
+@contextmanager
+def stage(name):
+    child = _stages.get(name)
+    if child is None:
+        child = _stages[name] = STAGE_SECONDS.labels(stage=name)
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        child.observe(time.perf_counter() - start)
+
+
+def log_sampled(msg, *args, level=logging.INFO):
+    if random.random() < LOG_SAMPLE_RATE:
+        logger.log(level, msg, *args)
+
+
+# ================= TRACE CONTEXT (W3C traceparent) =================
+def _new_id(nbytes):
+    return "%0*x" % (nbytes * 2, random.getrandbits(nbytes * 8))
+
+
+def child_traceparent(incoming):
+    # Keep the caller's trace id, start a new span for the hop to the collector
+    parts = (incoming or "").split("-")
+    if len(parts) == 4 and len(parts[1]) == 32:
+        return f"00-{parts[1]}-{_new_id(8)}-{parts[3]}"
+    return f"00-{_new_id(16)}-{_new_id(8)}-01"
+
+
+def trace_headers(request):
+    return {"traceparent": child_traceparent(request.headers.get("traceparent"))}
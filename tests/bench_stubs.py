@@ -0,0 +1,203 @@
+"""
+Local stand-ins for benchmarking and testing services without the full stack
+(standard library only).
+
+    python bench_stubs.py keycloak --port 8080   # JWKS + token endpoint, RS256
+    python bench_stubs.py sink --port 3000       # collector stand-in, 200 on every POST
+    python bench_stubs.py webhook --port 9000    # alert webhook stand-in, logs each notification
+
+Point the gateway at them with KEYCLOAK_URL=http://<host>:8080 and
+COLLECTOR_URL=http://<host>:3000. The keycloak stand-in prints an admin
+token at startup and also issues one on the usual password-grant endpoint.
+For collector benchmarks against a real database, run a throwaway
+TimescaleDB with db/init mounted instead (see README).
+"""
+import argparse
+import asyncio
+import base64
+import hashlib
+import json
+import random
+import secrets
+import time
+
+REALM = "NodeSense"
+
+# DER prefix of DigestInfo for SHA-256 (PKCS#1 v1.5)
+SHA256_PREFIX = bytes.fromhex("3031300d060960864801650304020105000420")
+
+
+# ================= RSA (RS256) =================
+def _is_probable_prime(n, rounds=40):
+    if n < 2:
+        return False
+    for p in (2, 3, 5, 7, 11, 13, 17, 19, 23, 29):
+        if n % p == 0:
+            return n == p
+    d, s = n - 1, 0
+    while d % 2 == 0:
+        d, s = d // 2, s + 1
+    for _ in range(rounds):
+        x = pow(random.randrange(2, n - 1), d, n)
+        if x in (1, n - 1):
+            continue
+        for _ in range(s - 1):
+            x = pow(x, 2, n)
+            if x == n - 1:
+                break
+        else:
+            return False
+    return True
+
+
+def _prime(bits):
+    while True:
+        candidate = secrets.randbits(bits) | (1 << (bits - 1)) | (1 << (bits - 2)) | 1
+        if _is_probable_prime(candidate):
+            return candidate
+
+
+def generate_key(bits=2048, e=65537):
+    while True:
+        p, q = _prime(bits // 2), _prime(bits // 2)
+        phi = (p - 1) * (q - 1)
+        if p != q and phi % e:
+            n = p * q
+            return n, e, pow(e, -1, phi)
+
+
+def _b64(data):
+    return base64.urlsafe_b64encode(data).rstrip(b"=").decode()
+
+
+def _int_bytes(value):
+    return value.to_bytes((value.bit_length() + 7) // 8, "big")
+
+
+def sign_rs256(key, claims, kid):
+    n, _, d = key
+    header = {"alg": "RS256", "typ": "JWT", "kid": kid}
+    signing_input = f"{_b64(json.dumps(header).encode())}.{_b64(json.dumps(claims).encode())}"
+    k = (n.bit_length() + 7) // 8
+    digest_info = SHA256_PREFIX + hashlib.sha256(signing_input.encode()).digest()
+    padded = b"\x00\x01" + b"\xff" * (k - len(digest_info) - 3) + b"\x00" + digest_info
+    signature = pow(int.from_bytes(padded, "big"), d, n).to_bytes(k, "big")
+    return f"{signing_input}.{_b64(signature)}"
+
+
+class KeycloakStub:
+    def __init__(self, port):
+        self.key = generate_key()
+        self.kid = "bench"
+        self.issuer = f"http://localhost:{port}/realms/{REALM}"
+        self.jwks = json.dumps({"keys": [{
+            "kid": self.kid, "kty": "RSA", "alg": "RS256", "use": "sig",
+            "n": _b64(_int_bytes(self.key[0])), "e": _b64(_int_bytes(self.key[1])),
+        }]}).encode()
+
+    def token(self, username="admin", ttl=86400):
+        now = int(time.time())
+        roles = ["admin", "viewer"] if username == "admin" else ["viewer"]
+        return sign_rs256(self.key, {
+            "iss": self.issuer, "sub": username, "preferred_username": username,
+            "aud": "account", "iat": now, "exp": now + ttl,
+            "realm_access": {"roles": roles},
+        }, self.kid)
+
+    def handle(self, method, path, body):
+        if path == f"/realms/{REALM}/protocol/openid-connect/certs":
+            return 200, self.jwks
+        if path == f"/realms/{REALM}/protocol/openid-connect/token" and method == "POST":
+            fields = dict(p.split("=", 1) for p in body.decode().split("&") if "=" in p)
+            return 200, json.dumps({
+                "access_token": self.token(fields.get("username", "admin")),
+                "token_type": "Bearer", "expires_in": 86400,
+            }).encode()
+        return 404, b'{"detail": "Not Found"}'
+
+
+class SinkStub:
+    def __init__(self):
+        self.received = 0
+
+    def handle(self, method, path, body):
+        self.received += 1
+        return 200, b'{"status":"ok"}'
+
+
+class WebhookStub:
+    def __init__(self, fail_rate=0.0):
+        self.fail_rate = fail_rate
+        self.received = 0
+
+    def handle(self, method, path, body):
+        # Optionally fail to exercise the alerting retry queue
+        if random.random() < self.fail_rate:
+            return 503, b'{"detail": "stub failure"}'
+        self.received += 1
+        notification = json.loads(body or b"{}")
+        print(f"[stub] webhook #{self.received}: {notification.get('title')}", flush=True)
+        return 200, b'{"status":"ok"}'
+
+
+# ================= SERVER =================
+async def serve_connection(handler, reader, writer):
+    try:
+        while True:
+            request_line = await reader.readline()
+            if not request_line:
+                break
+            method, path, _ = request_line.decode("latin-1").split(" ", 2)
+            length = 0
+            while True:
+                line = await reader.readline()
+                if line in (b"\r\n", b"\n", b""):
+                    break
+                key, _, value = line.decode("latin-1").partition(":")
+                if key.strip().lower() == "content-length":
+                    length = int(value)
+            body = await reader.readexactly(length) if length else b""
+            status, content = handler.handle(method, path.split("?", 1)[0], body)
+            reason = {200: "OK", 404: "Not Found", 503: "Service Unavailable"}.get(status, "Error")
+            writer.write(
+                f"HTTP/1.1 {status} {reason}\r\n"
+                f"Content-Type: application/json\r\nContent-Length: {len(content)}\r\n\r\n".encode()
+                + content
+            )
+            await writer.drain()
+    except (ConnectionError, asyncio.IncompleteReadError, ValueError):
+        pass
+    finally:
+        writer.close()
+
+
+async def main():
+    p = argparse.ArgumentParser(description="NodeSense benchmark stand-ins")
+    p.add_argument("kind", choices=["keycloak", "sink", "webhook"])
+    p.add_argument("--host", default="0.0.0.0")
+    p.add_argument("--port", type=int)
+    p.add_argument("--fail-rate", type=float, default=0.0, help="webhook: fraction of requests answered with 503")
+    args = p.parse_args()
+
+    if args.kind == "keycloak":
+        port = args.port or 8080
+        handler = KeycloakStub(port)
+        print(f"[stub] keycloak stand-in on :{port}, admin token:\n{handler.token()}", flush=True)
+    elif args.kind == "webhook":
+        port = args.port or 9000
+        handler = WebhookStub(args.fail_rate)
+        print(f"[stub] alert webhook on :{port}", flush=True)
+    else:
+        port = args.port or 3000
+        handler = SinkStub()
+        print(f"[stub] collector sink on :{port}", flush=True)
+
+    server = await asyncio.start_server(
+        lambda r, w: serve_connection(handler, r, w), args.host, port
+    )
+    async with server:
+        await server.serve_forever()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
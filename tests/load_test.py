@@ -1,97 +1,384 @@
-import requests
-import time
-import concurrent.futures
-import sys
+"""
+NodeSense load generator / benchmark harness.
+
+Simulates many agents with asyncio over raw keep-alive HTTP/1.1 connections
+(standard library only, so it runs inside any of the stack's python images)
+and writes a machine-readable report.
+
+    python load_test.py <TOKEN>                              # 50 agents, 30s, via gateway
+    python load_test.py --target collector --agents 20000 --interval 5 --shape batch
+    python load_test.py <TOKEN> --report run.json --baseline baselines/v1.2.json
+
+Latency is measured from the moment a request was *scheduled*, not sent, so
+a saturated target shows up as latency instead of silently lowering the
+offered load (coordinated omission). The send queue is unbounded; a request
+still waiting for a connection after --timeout is counted as a
+"backlog_timeout" error rather than dropped. Pure service time is reported too.
+"""
+import argparse
+import asyncio
+import json
 import os
 import random
+import ssl
+import sys
+import time
+from collections import Counter
+from datetime import datetime, timezone
+from urllib.parse import urlsplit
 
-# Config
 GATEWAY_URL = os.getenv("GATEWAY_URL", "http://gateway:8000")
-TOKEN = sys.argv[1] if len(sys.argv) > 1 else ""
-NUM_NODES = 50
-DURATION_SEC = 30
-INTERVAL = 1.0  # Send every 1s per node
-
-if not TOKEN:
-    print("Usage: python load_test.py <TOKEN>")
-    sys.exit(1)
-
-print(f"--- LOAD TEST STARTING ---")
-print(f"Nodes: {NUM_NODES}")
-print(f"Duration: {DURATION_SEC}s")
-print(f"Target URL: {GATEWAY_URL}/ingest")
-
-def simulate_node(node_idx):
-    node_id = f"load-test-node-{node_idx}"
-    start_time = time.time()
-    req_count = 0
-    err_count = 0
-    limited_count = 0
-    
-    url = f"{GATEWAY_URL}/ingest"
-    headers = {'Authorization': f'Bearer {TOKEN}', 'Content-Type': 'application/json'}
-    
-    while time.time() - start_time < DURATION_SEC:
-        # Simulate full suite of metrics matching Agent
-        mem_total = 16 * 1024 * 1024 * 1024 # 16 GB
-        mem_used = random.uniform(0.1, 0.9) * mem_total
+COLLECTOR_URL = os.getenv("COLLECTOR_URL", "http://collector:3000")
+
+# Payload shape -> ingest route
+SHAPES = {
+    "single": "/ingest",
+    "batch": "/ingest/containers",
+    "summary": "/ingest/summary",
+}
 
+
+# ================= PAYLOADS =================
+def now_iso():
+    return datetime.now(timezone.utc).isoformat()
+
+
+def node_metrics():
+    mem_total = 16 * 1024 * 1024 * 1024  # 16 GB
+    return [
+        {"name": "cpu_usage", "value": random.uniform(10, 90), "unit": "%"},
+        {"name": "mem_used", "value": random.uniform(0.1, 0.9) * mem_total, "unit": "bytes"},
+        {"name": "mem_total", "value": mem_total, "unit": "bytes"},
+        {"name": "disk_percent", "value": random.uniform(20, 80), "unit": "%"},
+        {"name": "process_count", "value": random.randint(50, 200), "unit": "count"},
+        {"name": "net_bytes_recv_rate", "value": random.uniform(1000, 1000000), "unit": "bytes/s"},
+        {"name": "net_bytes_sent_rate", "value": random.uniform(1000, 500000), "unit": "bytes/s"},
+    ]
+
+
+def build_body(shape, node_id, batch_size):
+    if shape == "single":
+        payload = {"node_id": node_id, "timestamp": now_iso(), "metrics": node_metrics()}
+    elif shape == "batch":
         payload = {
             "node_id": node_id,
-            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
-            "metrics": [
-                {"name": "cpu_usage", "value": random.uniform(10, 90), "unit": "%"},
-                {"name": "mem_used", "value": mem_used, "unit": "bytes"},
-                {"name": "mem_total", "value": mem_total, "unit": "bytes"},
-                {"name": "disk_percent", "value": random.uniform(20, 80), "unit": "%"},
-                {"name": "process_count", "value": random.randint(50, 200), "unit": "count"},
-                {"name": "net_bytes_recv", "value": random.uniform(1000, 1000000), "unit": "bytes"},
-                {"name": "net_bytes_sent", "value": random.uniform(1000, 500000), "unit": "bytes"}
-            ]
+            "timestamp": now_iso(),
+            "containers": [
+                {
+                    "id": f"{node_id}-c{i}",
+                    "name": f"bench-{i}",
+                    "labels": {"bench": "true"},
+                    "metrics": [
+                        {"name": "cpu_usage", "value": random.uniform(0, 100), "unit": "%"},
+                        {"name": "mem_used", "value": random.uniform(1e6, 1e9), "unit": "bytes"},
+                    ],
+                }
+                for i in range(batch_size)
+            ],
         }
+    else:
+        summaries = []
+        for m in node_metrics():
+            lo, hi = sorted((m["value"], m["value"] * random.uniform(1.0, 1.5)))
+            summaries.append({
+                "name": m["name"], "unit": m["unit"], "count": 60,
+                "min": lo, "max": hi, "sum": (lo + hi) * 30, "last": m["value"],
+            })
+        payload = {
+            "node_id": node_id,
+            "window_start": now_iso(),
+            "window_end": now_iso(),
+            "summaries": summaries,
+        }
+    return json.dumps(payload, separators=(",", ":")).encode()
+
+
+# ================= HTTP =================
+class Connection:
+    """Minimal keep-alive HTTP/1.1 client connection."""
+
+    def __init__(self, host, port, use_ssl):
+        self.host = host
+        self.port = port
+        self.ssl = ssl.create_default_context() if use_ssl else None
+        self.reader = None
+        self.writer = None
+
+    async def _connect(self):
+        self.reader, self.writer = await asyncio.open_connection(self.host, self.port, ssl=self.ssl)
+
+    def close(self):
+        if self.writer is not None:
+            self.writer.close()
+        self.reader = self.writer = None
+
+    async def request(self, method, path, headers, body):
+        if self.writer is None:
+            await self._connect()
+
+        head = f"{method} {path} HTTP/1.1\r\nHost: {self.host}\r\nContent-Length: {len(body)}\r\n"
+        head += "".join(f"{k}: {v}\r\n" for k, v in headers.items())
+        self.writer.write(head.encode() + b"\r\n" + body)
+        await self.writer.drain()
+
+        status_line = await self.reader.readline()
+        if not status_line:
+            raise ConnectionResetError("connection closed by peer")
+        status = int(status_line.split()[1])
+
+        length = None
+        chunked = False
+        keep_alive = True
+        while True:
+            line = await self.reader.readline()
+            if line in (b"\r\n", b"\n", b""):
+                break
+            key, _, value = line.decode("latin-1").partition(":")
+            key = key.strip().lower()
+            value = value.strip().lower()
+            if key == "content-length":
+                length = int(value)
+            elif key == "transfer-encoding" and "chunked" in value:
+                chunked = True
+            elif key == "connection" and value == "close":
+                keep_alive = False
+
+        if chunked:
+            while True:
+                size = int((await self.reader.readline()).split(b";")[0], 16)
+                await self.reader.readexactly(size + 2)
+                if size == 0:
+                    break
+        elif length:
+            await self.reader.readexactly(length)
+        elif length is None:
+            await self.reader.read()
+            keep_alive = False
+
+        if not keep_alive:
+            self.close()
+        return status
+
+
+# ================= STATS =================
+def percentiles(values):
+    if not values:
+        return {}
+    ordered = sorted(values)
+
+    def rank(q):
+        return ordered[min(int(q / 100 * len(ordered)), len(ordered) - 1)]
+
+    return {
+        "p50": rank(50),
+        "p95": rank(95),
+        "p99": rank(99),
+        "p999": rank(99.9),
+        "max": ordered[-1],
+        "mean": sum(ordered) / len(ordered),
+    }
+
+
+class Stats:
+    def __init__(self):
+        self.latencies = []
+        self.service_times = []
+        self.outcomes = Counter()
+
+    def record(self, outcome, scheduled, sent, done):
+        self.outcomes[outcome] += 1
+        if outcome == "ok":
+            self.latencies.append((done - scheduled) * 1000)
+            self.service_times.append((done - sent) * 1000)
+
+
+# ================= LOAD =================
+async def worker(queue, target, stats, args, headers):
+    conn = Connection(target.hostname, target.port or (443 if target.scheme == "https" else 80),
+                      target.scheme == "https")
+    path = (target.path.rstrip("/") or "") + SHAPES[args.shape]
+    while True:
+        job = await queue.get()
+        if job is None:
+            conn.close()
+            return
+        node_id, scheduled = job
+        sent = time.perf_counter()
+        if sent - scheduled > args.timeout:
+            # The client would already have given up; fail fast so the backlog drains
+            stats.record("backlog_timeout", scheduled, sent, sent)
+            continue
+        body = build_body(args.shape, node_id, args.batch_size)
         try:
-            resp = requests.post(url, headers=headers, json=payload, timeout=2)
-            if resp.status_code == 200:
-                pass
-            elif resp.status_code == 429:
-                limited_count += 1
+            status = await asyncio.wait_for(conn.request("POST", path, headers, body), args.timeout)
+            if 200 <= status < 300:
+                outcome = "ok"
+            elif status == 429:
+                outcome = "rate_limited"
             else:
-                err_count += 1
-                # print(f"Node {node_idx} Error: {resp.status_code}")
+                outcome = f"http_{status}"
+        except asyncio.TimeoutError:
+            conn.close()
+            outcome = "timeout"
         except Exception as e:
-            err_count += 1
-            # print(f"Node {node_idx} Exception: {e}")
-        
-        req_count += 1
-        time.sleep(INTERVAL)
-        
-    return req_count, err_count, limited_count
-
-# Run threads
-with concurrent.futures.ThreadPoolExecutor(max_workers=NUM_NODES) as executor:
-    futures = [executor.submit(simulate_node, i) for i in range(NUM_NODES)]
-    
-    total_req = 0
-    total_err = 0
-    total_limited = 0
-    for f in concurrent.futures.as_completed(futures):
-        r, e, l = f.result()
-        total_req += r
-        total_err += e
-        total_limited += l
-
-print(f"--- LOAD TEST FINISHED ---")
-print(f"Total Requests: {total_req}")
-print(f"Total Success: {total_req - total_err - total_limited}")
-print(f"Total Rate Limited (429): {total_limited}")
-print(f"Total Errors: {total_err}")
-
-if total_err > (total_req * 0.05): # Fail if > 5% ACTUAL errors (500, timeouts)
-    print("FAIL: Too many errors.")
-    sys.exit(1)
-elif total_req == 0:
-    print("FAIL: No requests sent.")
-    sys.exit(1)
-else:
-    print("SUCCESS: Infrastructure held up (Rate Limiting active).")
+            conn.close()
+            outcome = type(e).__name__
+        stats.record(outcome, scheduled, sent, time.perf_counter())
+
+
+async def generate(queue, stats, args):
+    # Agents are spread evenly over one interval and each fires every interval
+    rate = args.agents / args.interval
+    start = time.perf_counter()
+    end = start + args.duration
+    n = 0
+    while True:
+        scheduled = start + n / rate
+        if scheduled >= end:
+            break
+        delay = scheduled - time.perf_counter()
+        if delay > 0:
+            await asyncio.sleep(delay)
+        node_id = f"{args.node_prefix}-{n % args.agents}"
+        # Never drop: a backlog must show up as latency or backlog_timeout errors
+        queue.put_nowait((node_id, scheduled))
+        n += 1
+
+
+async def run(args):
+    base = args.url or (GATEWAY_URL if args.target == "gateway" else COLLECTOR_URL)
+    target = urlsplit(base)
+    headers = {"Content-Type": "application/json"}
+    if args.token:
+        headers["Authorization"] = f"Bearer {args.token}"
+
+    stats = Stats()
+    queue = asyncio.Queue()
+    workers = [
+        asyncio.ensure_future(worker(queue, target, stats, args, headers))
+        for _ in range(args.connections)
+    ]
+
+    started_at = now_iso()
+    started = time.perf_counter()
+    await generate(queue, stats, args)
+    for _ in workers:
+        await queue.put(None)
+    await asyncio.gather(*workers)
+    elapsed = time.perf_counter() - started
+
+    total = sum(stats.outcomes.values())
+    errors = {k: v for k, v in stats.outcomes.items() if k not in ("ok", "rate_limited")}
+    return {
+        "config": {
+            "target": args.target,
+            "url": base + SHAPES[args.shape],
+            "shape": args.shape,
+            "batch_size": args.batch_size if args.shape == "batch" else None,
+            "agents": args.agents,
+            "interval_s": args.interval,
+            "duration_s": args.duration,
+            "connections": args.connections,
+        },
+        "started_at": started_at,
+        "elapsed_s": round(elapsed, 3),
+        "requests": total,
+        "success": stats.outcomes.get("ok", 0),
+        "rate_limited": stats.outcomes.get("rate_limited", 0),
+        "errors": sum(errors.values()),
+        "error_breakdown": dict(sorted(errors.items())),
+        "offered_rps": round(args.agents / args.interval, 2),
+        "throughput_rps": round(stats.outcomes.get("ok", 0) / elapsed, 2) if elapsed else 0,
+        "latency_ms": {k: round(v, 3) for k, v in percentiles(stats.latencies).items()},
+        "service_time_ms": {k: round(v, 3) for k, v in percentiles(stats.service_times).items()},
+    }
+
+
+# ================= BASELINES =================
+def compare(report, baseline, tolerance):
+    regressions = []
+    ignored = ("url",)
+    if {k: v for k, v in baseline.get("config", {}).items() if k not in ignored} != \
+            {k: v for k, v in report["config"].items() if k not in ignored}:
+        print("WARNING: baseline was recorded with a different load config", file=sys.stderr)
+    base_tput = baseline.get("throughput_rps", 0)
+    if base_tput and report["throughput_rps"] < base_tput * (1 - tolerance):
+        regressions.append(f"throughput {report['throughput_rps']} rps < baseline {base_tput} rps")
+    base_requests, cur_requests = baseline.get("requests", 0), report["requests"]
+    if base_requests and cur_requests:
+        base_err = baseline.get("errors", 0) / base_requests
+        cur_err = report["errors"] / cur_requests
+        if cur_err > base_err * (1 + tolerance) + 0.001:
+            regressions.append(f"error rate {cur_err:.2%} > baseline {base_err:.2%}")
+    for q in ("p50", "p99"):
+        base_q = baseline.get("latency_ms", {}).get(q)
+        cur_q = report["latency_ms"].get(q)
+        if base_q and cur_q is not None and cur_q > base_q * (1 + tolerance):
+            regressions.append(f"{q} latency {cur_q} ms > baseline {base_q} ms")
+    return regressions
+
+
+def parse_args(argv):
+    p = argparse.ArgumentParser(description="NodeSense ingest load generator")
+    p.add_argument("token", nargs="?", default=os.getenv("TOKEN", ""),
+                   help="Bearer token (required for the gateway target)")
+    p.add_argument("--target", choices=["gateway", "collector"], default="gateway")
+    p.add_argument("--url", help="Base URL, overrides GATEWAY_URL / COLLECTOR_URL")
+    p.add_argument("--shape", choices=sorted(SHAPES), default="single")
+    p.add_argument("--batch-size", type=int, default=50, help="Containers per batch payload")
+    p.add_argument("--agents", type=int, default=50)
+    p.add_argument("--interval", type=float, default=1.0, help="Seconds between samples per agent")
+    p.add_argument("--duration", type=float, default=30.0)
+    p.add_argument("--connections", type=int, default=50, help="Concurrent keep-alive connections")
+    p.add_argument("--timeout", type=float, default=2.0)
+    p.add_argument("--node-prefix", default="load-test-node")
+    p.add_argument("--report", help="Write the JSON report to this file")
+    p.add_argument("--baseline", help="Compare against a stored report and fail on regression")
+    p.add_argument("--save-baseline", help="Store this run's report as a baseline")
+    p.add_argument("--tolerance", type=float, default=0.15, help="Allowed regression fraction")
+    p.add_argument("--max-error-rate", type=float, default=0.05)
+    return p.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    if args.target == "gateway" and not args.token:
+        print("Usage: python load_test.py <TOKEN> [options]  (or --target collector)")
+        sys.exit(1)
+
+    print("--- LOAD TEST STARTING ---", file=sys.stderr)
+    print(f"Agents: {args.agents} every {args.interval}s, shape={args.shape}, "
+          f"duration={args.duration}s, target={args.target}", file=sys.stderr)
+
+    report = asyncio.run(run(args))
+    text = json.dumps(report, indent=2)
+    print(text)
+
+    for path in filter(None, (args.report, args.save_baseline)):
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        with open(path, "w") as f:
+            f.write(text + "\n")
+
+    print("--- LOAD TEST FINISHED ---", file=sys.stderr)
+    if report["requests"] == 0:
+        print("FAIL: No requests sent.", file=sys.stderr)
+        sys.exit(1)
+    if report["errors"] > report["requests"] * args.max_error_rate:
+        print("FAIL: Too many errors.", file=sys.stderr)
+        sys.exit(1)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = compare(report, json.load(f), args.tolerance)
+        if regressions:
+            for r in regressions:
+                print(f"REGRESSION: {r}", file=sys.stderr)
+            sys.exit(2)
+        print("Baseline comparison OK.", file=sys.stderr)
+
+    print("SUCCESS: Infrastructure held up (Rate Limiting active).", file=sys.stderr)
     sys.exit(0)
+
+
+if __name__ == "__main__":
+    main()
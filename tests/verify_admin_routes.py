@@ -0,0 +1,51 @@
+import sys
+import urllib.request
+import urllib.error
+
+# Admin-only collector paths must be refused for a viewer token, whether they
+# are requested through their /api route or the gateway's generic proxy.
+#
+#     python tests/verify_admin_routes.py <VIEWER_TOKEN> [GATEWAY_URL]
+
+if len(sys.argv) < 2:
+    print("Usage: python tests/verify_admin_routes.py <VIEWER_TOKEN> [GATEWAY_URL]")
+    sys.exit(1)
+
+token = sys.argv[1]
+base = sys.argv[2].rstrip("/") if len(sys.argv) > 2 else "http://127.0.0.1:8000"
+
+# Short captures, so a broken guard doesn't hold the profiler for long
+checks = [
+    ("GET", "/api/system/profile?seconds=0.1"),
+    ("GET", "/debug/profile?seconds=0.1"),
+    ("GET", "//debug/profile?seconds=0.1"),
+    ("GET", "/nodes/../debug/profile?seconds=0.1"),
+    ("GET", "/api/jobs"),
+    ("GET", "/jobs"),
+    ("GET", "/jobs/1"),
+    # A node that doesn't exist, so a broken guard deletes nothing
+    ("DELETE", "/api/nodes/verify-admin-routes"),
+    ("DELETE", "/nodes/verify-admin-routes"),
+]
+
+
+def status(method, path):
+    req = urllib.request.Request(base + path, method=method, headers={"Authorization": f"Bearer {token}"})
+    try:
+        with urllib.request.urlopen(req) as response:
+            return response.getcode()
+    except urllib.error.HTTPError as e:
+        return e.code
+
+
+failures = 0
+for method, path in checks:
+    code = status(method, path)
+    ok = code == 403
+    failures += not ok
+    print(f"{'OK  ' if ok else 'FAIL'} {code} {method} {path}")
+
+if failures:
+    print(f"\nFAILURE: {failures} admin-only path(s) reachable with a viewer token.")
+    sys.exit(1)
+print("\nSUCCESS: every admin-only path returned 403 for a viewer token.")
@@ -3,7 +3,8 @@ import urllib.error
 import time
 from collections import Counter
 
-url = "http://127.0.0.1:8000/health"
+# /health and /ping are exempt from rate limiting, so use a proxied endpoint
+url = "http://127.0.0.1:8000/api/nodes?limit=1"
 results = []
 
 print(f"Testing Rate Limit on {url} with 110 requests...")